@@ -7,6 +7,7 @@ import os
 from flask import Flask
 from flask_socketio import SocketIO
 from flask_failsafe import failsafe
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 socketio = SocketIO(cors_allowed_origins="*")
 
@@ -18,23 +19,60 @@ def create_app(debug=False):
 	app = Flask(__name__)
 
 	# NEW IN HOMEWORK 3 ----------------------------
-	# This will prevent issues with cached static files
-	app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
+	# Built assets (/assets/, see `python -m flask_app.utils.assets.assets`) are
+	# fingerprinted and cached for a year; plain /static files only briefly, and
+	# not at all while debugging.
+	app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0 if debug else int(os.environ.get('STATIC_MAX_AGE', 3600))
 	app.debug = debug
+	# Render (like most hosts) puts one reverse proxy in front of the app, so
+	# request.remote_addr is the proxy's address; take the client from the
+	# X-Forwarded-For entry that proxy added. TRUSTED_PROXIES=0 when serving
+	# directly, or clients could pick their own address.
+	proxies = int(os.environ.get('TRUSTED_PROXIES', 1))
+	if proxies:
+		app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
 	# The secret key is used to cryptographically-sign the cookies used for storing the session data.
 	app.secret_key = 'AKWNF1231082fksejfOSEHFOISEHF24142124124124124iesfhsoijsopdjf'
 	# ----------------------------------------------
 
 	from .utils.database.database import database
+	# Migrates and seeds (including the owner/guest users) only when the
+	# schema files changed; see `python migrate.py` to do this outside of boot.
 	db = database()
-	
-	# NEW IN HOMEWORK 3 ----------------------------
-	# This will create a user
-	db.createUser(email='owner@email.com' ,password='password', role='owner', name='Owner')
-	db.createUser(email='guest@email.com' ,password='password', role='guest', name='Guest')
-	# ----------------------------------------------
+	app.extensions['database'] = db
+	# Compile (or load another worker's) resume snapshot before serving, so the
+	# first /resume request does no database I/O. If the database is down the
+	# first request retries instead.
+	try:
+		db.getResumeData()
+	except Exception:
+		pass
+
+	from .utils.assets import assets
+	assets.init_app(app)
+
+	# Sessions live server-side under an opaque cookie id (see SESSION_BACKEND)
+	from .utils.sessions import sessions
+	session_interface = sessions.init_app(app)
+
+	# Request timing, /metrics (Prometheus text format) and the opt-in profiler
+	from .utils.metrics import metrics
+	metrics.init_app(app)
+	metrics.registerCollector(lambda: [
+		(f"db_pool_{name}", f"Connection pool {name}.", {}, value) for name, value in db.poolStats().items()
+	] + [
+		(f"cache_{name}", f"Cache {name}.", {'cache': cache}, value)
+		for cache, stats in db.cacheStats().items() for name, value in stats.items()
+	] + [
+		(f"session_{name}", f"Session store {name}.", {}, value)
+		for name, value in (session_interface.stats() if session_interface else {}).items()
+	])
 
-	socketio.init_app(app)
+	# With several workers (or nodes), broadcasts must go through a shared
+	# message queue: redis://, amqp://, kafka://, zmq+tcp:// or local://host:port
+	# for the bundled broker (python -m flask_app.utils.chat.broker).
+	from .utils.chat.broker import clientManagerFromUrl
+	socketio.init_app(app, **clientManagerFromUrl(os.environ.get('SOCKETIO_MESSAGE_QUEUE')))
 
 	with app.app_context():
 		from . import routes
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS chat_messages (
+    message_id SERIAL PRIMARY KEY,
+    room VARCHAR(100) NOT NULL,
+    sent_at BIGINT NOT NULL,
+    msg TEXT NOT NULL,
+    msg_class VARCHAR(50)
+);
@@ -1,15 +1,114 @@
 # Author: Prof. MM Ghassemi <ghassem3@msu.edu>
 from flask import current_app as app
-from flask import render_template, redirect, request, session, url_for
+from flask import render_template, redirect, request, session, url_for, Response, stream_with_context
 from flask_socketio import emit, join_room, leave_room
-from .utils.database.database  import database
+from .utils.database.database import resume_cache
+from .utils.cache.cache import PageCache
+from .utils.ratelimit.ratelimit import limiterFromEnv
+from .utils.writebehind.writebehind import WriteBehindQueue
+from .utils.chat.history import ChatHistory
+from .utils.chat.coalesce import Coalescer
+from .utils.chat.presence import PresenceRegistry, SharedRoster
+from .utils.chat.broker import onRemoteEmit
+from .utils.export import export
+from .utils.metrics import metrics
+from .utils.metrics.metrics import timedEvent
+from .utils.logs.logs import getLogger
 from werkzeug.datastructures import ImmutableMultiDict
-from pprint import pprint
+import os
+import re
+import hmac
 import json
 import random
 import functools
 from . import socketio
-db = database(purge=True)
+db = app.extensions['database']
+log = getLogger(__name__)
+
+# Login attempts are limited per email and per client IP before any hashing
+# or database work happens (see LOGIN_RATE_LIMIT / LOGIN_IP_RATE_LIMIT /
+# RATE_LIMIT_BACKEND). The IP limit is looser: several people can share an
+# address (an office, a carrier NAT).
+login_limiter = limiterFromEnv('LOGIN_RATE_LIMIT', default='5/60')
+login_ip_limiter = limiterFromEnv('LOGIN_IP_RATE_LIMIT', default='30/60')
+
+# Feedback submissions are queued and written in batches by a background
+# worker; set FEEDBACK_WRITE_BEHIND=0 to insert synchronously instead.
+FEEDBACK_COLUMNS = ['name', 'email', 'comment']
+feedback_queue = WriteBehindQueue(
+    flush=lambda rows: db.insertRows(table='feedback', columns=FEEDBACK_COLUMNS, parameters=rows),
+    name='feedback',
+    maxsize=int(os.environ.get('FEEDBACK_QUEUE_SIZE', 1000)),
+    batch_size=int(os.environ.get('FEEDBACK_BATCH_SIZE', 100)),
+    interval=float(os.environ.get('FEEDBACK_FLUSH_INTERVAL', 0.5))
+)
+
+# Last CHAT_HISTORY_SIZE messages of up to CHAT_HISTORY_ROOMS rooms are kept
+# in memory and replayed to clients when they join.
+chat_history = ChatHistory(
+    db,
+    size=int(os.environ.get('CHAT_HISTORY_SIZE', 50)),
+    max_rooms=int(os.environ.get('CHAT_HISTORY_ROOMS', 100))
+)
+
+# Chat messages other workers broadcast through the message queue go into
+# this worker's history buffers too (they carry their 'sent_at').
+def rememberRemoteMessage(message):
+    # The payload is the list of emit() arguments (a bare value in older versions)
+    data = message.get('data')
+    if isinstance(data, (list, tuple)):
+        data = data[0] if len(data) == 1 else None
+    if message.get('namespace') != '/chat' or not isinstance(data, dict):
+        return
+    if message['event'] == 'batch':
+        events = data.get('events', [])
+    else:
+        events = [{'event': message['event'], 'data': data}]
+    for event in events:
+        if event['event'] == 'status' and isinstance(event['data'], dict) and 'sent_at' in event['data']:
+            chat_history.receive(message['room'], event['data'])
+
+onRemoteEmit(socketio.server.manager, rememberRemoteMessage)
+
+# Optional: group chat broadcasts sent within CHAT_COALESCE_MS into one
+# 'batch' frame per client (at most CHAT_COALESCE_MAX_BATCH events each).
+coalescer = None
+if float(os.environ.get('CHAT_COALESCE_MS', 0)) > 0:
+    coalescer = Coalescer(
+        socketio,
+        namespace='/chat',
+        interval=float(os.environ['CHAT_COALESCE_MS']) / 1000,
+        max_batch=int(os.environ.get('CHAT_COALESCE_MAX_BATCH', 50))
+    )
+
+# Who is in which chat room, plus a per-room message budget so one noisy
+# room can't monopolize the worker (CHAT_ROOM_RATE_LIMIT messages/seconds).
+# With a message queue several workers serve the chat, so room member lists
+# come from a roster they share (CHAT_PRESENCE=shared|local to override).
+presence_mode = os.environ.get('CHAT_PRESENCE', 'shared' if os.environ.get('SOCKETIO_MESSAGE_QUEUE') else 'local')
+presence = PresenceRegistry(roster=SharedRoster() if presence_mode == 'shared' else None)
+room_limiter = limiterFromEnv('CHAT_ROOM_RATE_LIMIT', default='20/1')
+CHAT_IDLE_TIMEOUT = float(os.environ.get('CHAT_IDLE_TIMEOUT', 1800))
+
+# Rendered pages for anonymous visitors; any resume data change bumps the
+# resume cache version, which re-renders them on the next request.
+page_cache = PageCache(
+    version=resume_cache.version,
+    maxsize=int(os.environ.get('PAGE_CACHE_SIZE', 64)),
+    ttl=float(os.environ.get('PAGE_CACHE_TTL', 300))
+)
+FUN_FACTS = ['I started university when I was a wee lad of 15 years.', 'I have a pet sparrow.', 'I write poetry.']
+
+# Queue depth, flush counters and presence are exported with every /metrics scrape
+def queueGauges():
+    queues = {'feedback': feedback_queue.stats(), 'chat': chat_history.stats()['writer']}
+    gauges = [(f"writebehind_{name}", f"Write-behind queue {name}.", {'queue': queue}, value)
+              for queue, stats in queues.items() for name, value in stats.items()]
+    gauges += [(f"chat_{name}", f"Chat {name} in this worker.", {}, value) for name, value in presence.stats().items()]
+    gauges += [(f"page_cache_{name}", f"Page cache {name}.", {}, value) for name, value in page_cache.stats().items()]
+    return gauges
+
+metrics.registerCollector(queueGauges)
 
 #######################################################################################
 # AUTHENTICATION RELATED
@@ -22,6 +121,34 @@ def login_required(func):
         return func(*args, **kwargs)
     return secure_function
 
+# Owner-only routes trust server-side configuration, never the session role
+# (which anyone can pick at registration): the signed-in email must be on
+# OWNER_EMAILS, or the request must carry `Authorization: Bearer <ADMIN_TOKEN>`.
+# With neither configured they are closed to everyone.
+OWNER_EMAILS = {email.strip().lower() for email in os.environ.get('OWNER_EMAILS', '').split(',') if email.strip()}
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+def isOwner():
+    if ADMIN_TOKEN and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {ADMIN_TOKEN}"):
+        return True
+    if "email" not in session or not OWNER_EMAILS:
+        return False
+    try:
+        email = db.reversibleEncrypt('decrypt', session['email'])
+    except Exception:
+        return False
+    return email.lower() in OWNER_EMAILS
+
+def owner_required(func):
+    @functools.wraps(func)
+    def secure_function(*args, **kwargs):
+        if isOwner():
+            return func(*args, **kwargs)
+        if "email" not in session:
+            return redirect(url_for("login", next=request.url))
+        return "Forbidden", 403
+    return secure_function
+
 def getUser():
 	return session.get('name', 'Unknown')
 
@@ -39,11 +166,25 @@ def processlogin():
 	form_fields = dict((key, request.form.getlist(key)[0]) for key in list(request.form.keys()))
 	email = form_fields['email']
 	password = form_fields['password']
+
+	# Reject throttled clients before doing any work
+	for limiter, key in ((login_limiter, f"email:{email.lower()}"), (login_ip_limiter, f"ip:{request.remote_addr}")):
+		allowed, retry_after = limiter.hit(key)
+		if not allowed:
+			log.warning("login throttled", extra={'key': key.split(':', 1)[0], 'ip': request.remote_addr})
+			return json.dumps({
+				'success': 0,
+				'message': f"Too many login attempts. Try again in {int(retry_after) + 1} seconds."
+			})
 	
 	# Authenticate the user
 	auth_result = db.authenticate(email=email, password=password)
 	
 	if auth_result['success'] == 1:
+		login_limiter.reset(f"email:{email.lower()}")
+		# New session id on login, so an id planted beforehand is useless
+		if hasattr(session, 'regenerate'):
+			session.regenerate()
 		# Store the encrypted email and name in the session
 		session['email'] = db.reversibleEncrypt('encrypt', email)
 		session['name'] = auth_result['name']
@@ -59,6 +200,7 @@ def processlogin():
 
 		failed_attempts = session.get('failed_attempts', 0) + 1
 		session['failed_attempts'] = failed_attempts
+		log.info("login failed", extra={'ip': request.remote_addr, 'failed_attempts': failed_attempts})
 		
 
 		return json.dumps({
@@ -74,35 +216,120 @@ def processlogin():
 @app.route('/chat')
 @login_required
 def chat():
-    return render_template('chat.html', user=getUser())
+    return render_template('chat.html', user=getUser(), room=chatRoom(request.args.get('room')))
+
+ROOM_NAME = re.compile(r'^[A-Za-z0-9_-]{1,50}$')
+
+def chatRoom(name):
+    return name if isinstance(name, str) and ROOM_NAME.match(name) else 'main'
+
+def chatRole():
+    return "Owner" if session.get('role') == 'owner' else "Guest"
+
+def broadcast(event, data, room):
+    if coalescer is not None:
+        coalescer.emit(event, data, room)
+    else:
+        emit(event, data, to=room)
+
+def broadcastPresence(room):
+    broadcast('presence', {'room': room, 'users': presence.members(room)}, room)
+
+def leaveChat(sid):
+    # Shared by 'left' and disconnects; only announces once per connection
+    member = presence.leave(sid)
+    if member is None:
+        return
+    leave_room(member['room'])
+    broadcast('status', {'msg': f"{member['user']} ({member['role']}) has left the room.", 'class': 'system-message'}, member['room'])
+    broadcastPresence(member['room'])
+
+def reapIdleConnections():
+    while True:
+        socketio.sleep(min(60, CHAT_IDLE_TIMEOUT))
+        presence.heartbeat()
+        idle = presence.idle(CHAT_IDLE_TIMEOUT)
+        for sid in idle:
+            socketio.server.disconnect(sid, namespace='/chat')
+        if idle:
+            log.info("disconnected idle chat clients", extra={'count': len(idle)})
+
+idle_reaper = None
 
 @socketio.on('joined', namespace='/chat')
+@timedEvent('/chat', 'joined')
 def joined(message):
-    join_room('main')
+    global idle_reaper
+    if idle_reaper is None:
+        idle_reaper = socketio.start_background_task(reapIdleConnections)
+
+    room = chatRoom(message.get('room'))
     user = getUser()
-    is_owner = session.get('role') == 'owner'
-    role = "Owner" if is_owner else "Guest"
-    emit('status', {'msg': f"{user} ({role}) has entered the room.", 'class': 'system-message'}, broadcast=True)
+    role = chatRole()
+    previous = presence.join(request.sid, room, user, role)
+    if previous is not None:
+        leave_room(previous)
+        broadcastPresence(previous)
+    join_room(room)
+
+    # Backfill only the joining client
+    messages = chat_history.recent(room)
+    emit('history', {'messages': messages, 'before': messages[0]['sent_at'] if messages else None})
+    broadcast('status', {'msg': f"{user} ({role}) has entered the room.", 'class': 'system-message'}, room)
+    broadcastPresence(room)
 
 @socketio.on('left', namespace='/chat')
+@timedEvent('/chat', 'left')
 def left(message):
-    user = getUser()
-    is_owner = session.get('role') == 'owner'
-    role = "Owner" if is_owner else "Guest"
-    emit('status', {'msg': f"{user} ({role}) has left the room.", 'class': 'system-message'}, broadcast=True)
-    leave_room('main')
+    leaveChat(request.sid)
+
+@socketio.on('disconnect', namespace='/chat')
+@timedEvent('/chat', 'disconnect')
+def disconnected(*args):
+    leaveChat(request.sid)
 
 @socketio.on('message', namespace='/chat')
+@timedEvent('/chat', 'message')
 def handle_message(message):
-    user = getUser()
+    member = presence.member(request.sid)
+    if member is None:
+        return
+    presence.touch(request.sid)
+    room = member['room']
+
+    allowed, retry_after = room_limiter.hit(f"room:{room}")
+    if not allowed:
+        log.warning("chat room throttled", extra={'room': room})
+        emit('status', {'msg': "This room is busy, please slow down.", 'class': 'system-message'})
+        return
+
     is_owner = session.get('role') == 'owner'
-    role = "Owner" if is_owner else "Guest"
-    
     msg_class = 'owner-message' if is_owner else 'user-message'
     
-    formatted_msg = f"{user} ({role}): {message['msg']}"
+    formatted_msg = f"{member['user']} ({member['role']}): {message['msg']}"
+    stored = chat_history.append(room, formatted_msg, msg_class)
     
-    emit('status', {'msg': formatted_msg, 'class': msg_class}, broadcast=True)
+    broadcast('status', {'msg': formatted_msg, 'class': msg_class, 'sent_at': stored['sent_at']}, room)
+
+@socketio.on('presence', namespace='/chat')
+@timedEvent('/chat', 'presence')
+def presencelist(message):
+    member = presence.member(request.sid)
+    if member is not None:
+        presence.touch(request.sid)
+        emit('presence', {'room': member['room'], 'users': presence.members(member['room'])})
+
+@socketio.on('history', namespace='/chat')
+@timedEvent('/chat', 'history')
+def history(message):
+    # Page further back from the oldest message the client has seen
+    member = presence.member(request.sid)
+    before = message.get('before')
+    if member is None or not isinstance(before, int):
+        return
+    presence.touch(request.sid)
+    messages = chat_history.older(member['room'], before=before, limit=50)
+    emit('history', {'messages': messages, 'before': messages[0]['sent_at'] if messages else None, 'older': True})
 
 #######################################################################################
 # OTHER
@@ -115,21 +342,38 @@ def root():
 
 @app.route('/home')
 def home():
-	x = random.choice(['I started university when I was a wee lad of 15 years.','I have a pet sparrow.','I write poetry.'])
-	return render_template('home.html', fun_fact = x)
+	x = random.randrange(len(FUN_FACTS))
+	return cachedPage(('home', x), lambda: render_template('home.html', fun_fact = FUN_FACTS[x]))
 
 @app.route('/resume')
 def resume():
-	resume_data = db.getResumeData()
-	return render_template('resume.html', resume_data = resume_data)
+	return cachedPage(('resume',), lambda: render_template('resume.html', resume_data = db.getResumeData()))
 
 @app.route('/projects')
 def projects():
-    return render_template('projects.html')
+    return cachedPage(('projects',), lambda: render_template('projects.html'))
 
 @app.route('/piano')
 def piano():
-    return render_template('piano.html')
+    return cachedPage(('piano',), lambda: render_template('piano.html'))
+
+def cachedPage(key, render):
+    # Only anonymous visitors share pages; the layout shows the logged-in name
+    if 'email' in session or 'name' in session:
+        return render()
+    body, etag = page_cache.get(key, render)
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def warmPages():
+    # Render every fun-fact variant of /home up front
+    with app.test_request_context('/home'):
+        for x in range(len(FUN_FACTS)):
+            page_cache.get(('home', x), lambda: render_template('home.html', fun_fact = FUN_FACTS[x]))
+
+warmPages()
 
 @app.route('/processfeedback', methods=['POST'])
 def processfeedback():
@@ -139,14 +383,63 @@ def processfeedback():
     email = feedback.get('email')
     comment = feedback.get('comment')
     
-    columns = ['name', 'email', 'comment']
     parameters = [[name, email, comment]]
-    db.insertRows(table='feedback', columns=columns, parameters=parameters)
-    
-    feedback_query = "SELECT * FROM feedback ORDER BY comment_id DESC"
-    all_feedback = db.query(feedback_query)
+    if os.environ.get('FEEDBACK_WRITE_BEHIND', '1') == '0':
+        db.insertRows(table='feedback', columns=FEEDBACK_COLUMNS, parameters=parameters)
+    elif not feedback_queue.submit(parameters[0], timeout=0.5):
+        # Backpressure: the queue is full, ask the client to retry shortly
+        log.warning("feedback queue full", extra={'depth': feedback_queue.stats()['depth']})
+        return render_template('processfeedback.html', feedback_data=[], busy=True), 503, {'Retry-After': '5'}
     
-    return render_template('processfeedback.html', feedback_data=all_feedback)
+    return feedbackpage()
+
+@app.route('/feedback')
+def feedbackpage():
+    before = request.args.get('before', type=int)
+    page = db.getFeedbackPage(before=before, limit=feedbackPageSize())
+    feedback_data = page['feedback']
+    if before is None:
+        # Show accepted-but-unwritten submissions on top of the first page
+        pending = [dict(zip(FEEDBACK_COLUMNS, row)) for row in reversed(feedback_queue.pending())]
+        feedback_data = pending + feedback_data
+    return streamTemplate('processfeedback.html', feedback_data=feedback_data, next_cursor=page['next'])
+
+@app.route('/feedback/stats')
+def feedbackstats():
+    return json.dumps(feedback_queue.stats()), 200, {'Content-Type': 'application/json'}
+
+@app.route('/feedback.json')
+def feedbackjson():
+    page = db.getFeedbackPage(before=request.args.get('before', type=int), limit=feedbackPageSize())
+    return json.dumps(page, default=str), 200, {'Content-Type': 'application/json'}
+
+@app.route('/export/<table>.<fmt>')
+@owner_required
+def exportTable(table, fmt):
+    # Streamed straight from a server-side cursor; pass ?after=<key> to resume
+    if table not in export.HTTP_EXPORT_TABLES or fmt not in export.FORMATS:
+        return "Not Found", 404
+    after = request.args.get('after', type=int)
+    chunks = export.exportChunks(db, table, fmt=fmt, after=after, header=after is None)
+    response = Response(stream_with_context(text for text, _ in chunks), mimetype=export.MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f"attachment; filename={table}.{fmt}"
+    return response
+
+def feedbackPageSize():
+    # Clamp client-supplied page sizes so one request can't ask for the whole table
+    limit = request.args.get('limit', type=int) or app.config.get('FEEDBACK_PAGE_SIZE', 20)
+    return max(1, min(limit, 100))
+
+def streamTemplate(template_name, **context):
+    """
+    Render a template as a stream of chunks so long pages start reaching
+    the client before rendering finishes.
+    """
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    # Flush every few template events instead of every single one
+    stream.enable_buffering(20)
+    return Response(stream_with_context(stream), mimetype='text/html')
 
 @app.route('/register')
 def register():
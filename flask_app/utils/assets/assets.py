@@ -0,0 +1,347 @@
+import io
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+import mimetypes
+import posixpath
+from ..cache.cache import atomicWrite
+from ..logs.logs import getLogger
+
+# Optional build-time dependencies; without them the build skips brotli
+# variants, resized/WebP images, or falls back to the built-in minifiers.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+log = getLogger(__name__)
+
+STATIC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'static'))
+BUILD_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = 'manifest.json'
+URL_PREFIX = '/assets/'
+
+# Bundles linked from shared/layout.html, in cascade/execution order.
+BUNDLES = {
+    'site.css': [
+        'main/css/main.css',
+        'main/css/piano.css',
+        'main/css/header.css',
+        'main/css/footer.css',
+        'main/css/resume.css',
+        'main/css/feedback.css',
+        'main/css/processfeedback.css',
+    ],
+    'site.js': [
+        'main/piano/js/piano.js',
+        'main/js/feedback.js',
+    ],
+}
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.ico', '.xml')
+RESIZABLE = ('.jpg', '.jpeg', '.png')
+IMAGE_WIDTHS = [int(w) for w in os.environ.get('ASSET_IMAGE_WIDTHS', '480,960,1600').split(',') if w.strip()]
+ONE_YEAR = 365 * 24 * 3600
+
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+#######################################################################################
+# BUILD
+#######################################################################################
+def build(static_dir=STATIC_DIR, build_dir=BUILD_DIR):
+    """
+    Fingerprint every static file, concatenate and minify the BUNDLES,
+    produce resized/WebP image variants and gzip/brotli copies, and write
+    `manifest.json` mapping logical names to the built files.
+
+    Run with `python -m flask_app.utils.assets.assets` before starting the app.
+
+    Returns:
+        dict: The manifest.
+    """
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    os.makedirs(build_dir)
+    manifest = {'files': {}, 'images': {}}
+
+    # (1) Fingerprint the plain files so bundles can reference them.
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != build_dir]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            manifest['files'][logical] = _emit(build_dir, logical, data)
+            if logical.lower().endswith(RESIZABLE) and Image is not None:
+                manifest['images'][logical] = _imageVariants(source, logical, build_dir)
+
+    # (2) Bundles; CSS url() references are rewritten to fingerprinted files.
+    for bundle, sources in BUNDLES.items():
+        parts = []
+        for logical in sources:
+            path = os.path.join(static_dir, logical)
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"{bundle}: bundle source {logical} does not exist")
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            if bundle.endswith('.css'):
+                text = _rewriteCssUrls(text, logical, manifest)
+            parts.append(text)
+        minified = (minifyCss if bundle.endswith('.css') else minifyJs)("\n".join(parts))
+        manifest['files']['bundles/' + bundle] = _emit(build_dir, 'bundles/' + bundle, minified.encode('utf-8'))
+
+    # (3) Precompressed variants, kept only when they are actually smaller.
+    for built in list(manifest['files'].values()):
+        if built.lower().endswith(COMPRESSIBLE):
+            _compress(os.path.join(build_dir, built))
+
+    atomicWrite(os.path.join(build_dir, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+    log.info("assets built", extra={'files': len(manifest['files']), 'images': len(manifest['images']),
+                                    'brotli': brotli is not None, 'pillow': Image is not None})
+    return manifest
+
+
+def _emit(build_dir, logical, data):
+    """
+    Write `data` as <name>.<hash>.<ext> under `build_dir` and return its relative path.
+    """
+    stem, ext = posixpath.splitext(logical)
+    built = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+    path = os.path.join(build_dir, built)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return built
+
+
+def _imageVariants(source, logical, build_dir):
+    """
+    Returns [{'width', 'type', 'file'}, ...]: the image re-encoded as WebP at
+    its own size plus JPEG/PNG and WebP copies at each smaller IMAGE_WIDTHS.
+    """
+    variants = []
+    with Image.open(source) as image:
+        image.load()
+        width, height = image.size
+        original_type = Image.MIME.get(image.format, 'image/jpeg')
+        for target in sorted(set([w for w in IMAGE_WIDTHS if w < width] + [width])):
+            resized = image if target == width else image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+            encodings = [('image/webp', 'WEBP', '.webp', {'quality': 80, 'method': 6})]
+            if target != width:
+                encodings.append((original_type, image.format, posixpath.splitext(logical)[1], {'quality': 82, 'optimize': True}))
+            for mime, fmt, ext, options in encodings:
+                frame = resized
+                if fmt == 'JPEG' and frame.mode != 'RGB':
+                    frame = frame.convert('RGB')
+                elif fmt == 'WEBP' and frame.mode not in ('RGB', 'RGBA'):
+                    frame = frame.convert('RGBA' if frame.mode in ('P', 'LA', 'PA') else 'RGB')
+                buffer = io.BytesIO()
+                frame.save(buffer, fmt, **options)
+                stem = posixpath.splitext(logical)[0]
+                variant = f"{stem}-{target}w{ext}"
+                variants.append({'width': target, 'type': mime, 'file': _emit(build_dir, variant, buffer.getvalue())})
+    return variants
+
+
+def _compress(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    packed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(packed) < len(data):
+        with open(path + '.gz', 'wb') as f:
+            f.write(packed)
+    if brotli is not None:
+        packed = brotli.compress(data, quality=11)
+        if len(packed) < len(data):
+            with open(path + '.br', 'wb') as f:
+                f.write(packed)
+
+
+def _rewriteCssUrls(text, logical, manifest):
+    """
+    Point url() references at fingerprinted files. Large images use their
+    widest resized copy (at most max(IMAGE_WIDTHS) pixels) instead of the original.
+    """
+    files = manifest['files']
+
+    def replace(match):
+        ref = match.group(2).strip()
+        if re.match(r'^(data:|[a-z]+:|//|#)', ref, re.IGNORECASE):
+            return match.group(0)
+        target = ref.lstrip('/') if ref.startswith('/static/') else posixpath.normpath(posixpath.join(posixpath.dirname(logical), ref))
+        target = target[len('static/'):] if target.startswith('static/') else target
+        if target not in files:
+            # The bundle lives elsewhere, so keep pointing at the original location
+            log.warning("css url not found in static files", extra={'source': logical, 'url': ref})
+            return f"url('/static/{target}')"
+        resized = [v for v in manifest['images'].get(target, []) if v['type'] != 'image/webp']
+        built = max(resized, key=lambda v: v['width'])['file'] if resized else files[target]
+        return f"url('{URL_PREFIX}{built}')"
+    return _CSS_URL.sub(replace, text)
+
+
+def minifyCss(text):
+    """
+    Minify CSS with rcssmin when installed, otherwise strip comments and
+    whitespace that carries no meaning.
+    """
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.DOTALL)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    # Only inside declaration blocks: in a selector the space before a
+    # pseudo-class is a descendant combinator (div :first-child)
+    text = re.sub(r'\{[^{}]*\}', lambda block: re.sub(r'\s*:\s*', ':', block.group(0)), text)
+    return text.replace(';}', '}').strip()
+
+
+def minifyJs(text):
+    """
+    Minify JavaScript with rjsmin when installed, otherwise only drop
+    indentation, blank lines, whole-line // comments and /* */ comments at
+    the start of a line, keeping any code after them (safe for any script).
+    """
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    lines = []
+    in_comment = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        while True:
+            if in_comment:
+                end = stripped.find('*/')
+                if end < 0:
+                    stripped = ''
+                    break
+                in_comment = False
+                stripped = stripped[end + 2:].strip()
+            if not stripped.startswith('/*'):
+                break
+            in_comment = True
+            stripped = stripped[2:]
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return "\n".join(lines)
+
+
+#######################################################################################
+# SERVING
+#######################################################################################
+def loadManifest(build_dir=BUILD_DIR):
+    """
+    Returns the manifest written by build(), or None if the assets were not built.
+    """
+    try:
+        with open(os.path.join(build_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def init_app(app, build_dir=BUILD_DIR):
+    """
+    Serve built assets from /assets/ with immutable caching and
+    Accept-Encoding negotiation, and add the template helpers:
+
+    - asset_url(filename): fingerprinted URL of a static file (url_for('static') if not built)
+    - asset_bundle(name): list of URLs for a BUNDLES entry (its sources if not built)
+    - asset_picture(filename, alt, class_, sizes): <picture> with WebP and resized sources
+    """
+    from flask import url_for, request, send_file, abort
+    from markupsafe import Markup, escape
+    from werkzeug.security import safe_join
+
+    manifest = loadManifest(build_dir)
+    if manifest is None:
+        log.info("assets not built, serving sources from /static", extra={'build_dir': build_dir})
+        manifest = {'files': {}, 'images': {}}
+    files, images = manifest['files'], manifest['images']
+
+    def asset_url(filename):
+        built = files.get(filename)
+        if built is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=built)
+
+    def asset_bundle(name):
+        if 'bundles/' + name in files:
+            return [asset_url('bundles/' + name)]
+        return [url_for('static', filename=source) for source in BUNDLES[name]
+                if os.path.isfile(os.path.join(app.static_folder, source))]
+
+    def asset_srcset(filename, mime):
+        return ', '.join(f"{url_for('assets', filename=v['file'])} {v['width']}w"
+                         for v in images.get(filename, []) if v['type'] == mime)
+
+    def asset_picture(filename, alt='', class_='', sizes='100vw'):
+        src = asset_url(filename)
+        attributes = f'src="{escape(src)}" alt="{escape(alt)}" class="{escape(class_)}"'
+        variants = images.get(filename)
+        if not variants:
+            return Markup(f'<img {attributes}>')
+        width = max(v['width'] for v in variants)
+        fallback = [f"{url_for('assets', filename=v['file'])} {v['width']}w" for v in variants if v['type'] != 'image/webp']
+        fallback.append(f"{src} {width}w")
+        return Markup(
+            f'<picture><source type="image/webp" srcset="{escape(asset_srcset(filename, "image/webp"))}" sizes="{escape(sizes)}">'
+            f'<img {attributes} srcset="{escape(", ".join(fallback))}" sizes="{escape(sizes)}"></picture>'
+        )
+
+    app.jinja_env.globals.update(asset_url=asset_url, asset_bundle=asset_bundle, asset_picture=asset_picture)
+
+    encodings = (('br', '.br'), ('gzip', '.gz'))
+
+    @app.route(URL_PREFIX + '<path:filename>', endpoint='assets')
+    def assets(filename):
+        path = safe_join(build_dir, filename)
+        if path is None or filename == MANIFEST or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for name, suffix in encodings:
+            if request.accept_encodings[name] and os.path.isfile(path + suffix):
+                path, encoding = path + suffix, name
+                break
+        response = send_file(path, mimetype=mimetype, max_age=ONE_YEAR, conditional=True)
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        response.vary.add('Accept-Encoding')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed static assets.')
+    parser.add_argument('--static-dir', default=STATIC_DIR)
+    parser.add_argument('--build-dir', default=BUILD_DIR)
+    args = parser.parse_args()
+
+    manifest = build(args.static_dir, args.build_dir)
+    total = lambda paths: sum(os.path.getsize(os.path.join(args.build_dir, p)) for p in paths)
+    print(f"Built {len(manifest['files'])} files and {sum(len(v) for v in manifest['images'].values())} image variants into {args.build_dir}")
+    for bundle in BUNDLES:
+        built = manifest['files']['bundles/' + bundle]
+        sizes = [f"{suffix or 'raw'} {os.path.getsize(os.path.join(args.build_dir, built + suffix))} B"
+                 for suffix in ('', '.gz', '.br') if os.path.isfile(os.path.join(args.build_dir, built + suffix))]
+        print(f"  {bundle}: {', '.join(sizes)}")
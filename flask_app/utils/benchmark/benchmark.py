@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def configure(database_url=None, clients=8):
+    """
+    Point the app at a throwaway SQLite database and cache directory (unless
+    DATABASE_URL/CACHE_DIR are already set) and lift the rate limits, so the
+    benchmark measures the request path rather than the throttling. Must run
+    before flask_app is imported.
+    """
+    workdir = tempfile.mkdtemp(prefix='personalsite-bench-')
+    os.environ['DATABASE_URL'] = database_url or os.environ.get('DATABASE_URL') or f"sqlite:///{workdir}/bench.db"
+    os.environ.setdefault('CACHE_DIR', os.path.join(workdir, 'cache'))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('DB_POOL_SIZE', str(clients))
+    os.environ['LOGIN_RATE_LIMIT'] = '1000000/1'
+    os.environ['LOGIN_IP_RATE_LIMIT'] = '1000000/1'
+    os.environ['CHAT_ROOM_RATE_LIMIT'] = '1000000/1'
+    return workdir
+
+
+class Bench:
+    """
+    Boots create_app() once and runs scenarios against it with concurrent
+    clients (one Flask test client, and Socket.IO test client, per thread).
+    """
+
+    def __init__(self):
+        from flask_app import create_app, socketio
+        from flask_app.utils.metrics import metrics
+        self.app = create_app(debug=False)
+        self.socketio = socketio
+        self.metrics = metrics
+        self.routes = sys.modules['flask_app.routes']
+
+    def login(self, client):
+        response = client.post('/processlogin', data={'email': 'owner@email.com', 'password': 'password'})
+        assert json.loads(response.data)['success'] == 1, response.data
+
+    def scenarios(self):
+        """
+        Returns {name: (setup(client) -> state, request(client, state, i))}.
+        """
+        def get(path):
+            def request(client, state, i):
+                response = client.get(path)
+                assert response.status_code == 200, (path, response.status_code)
+            return request
+
+        def login(client, state, i):
+            self.login(client)
+
+        def feedback(client, state, i):
+            response = client.post('/processfeedback', data={'name': 'Bench', 'email': 'bench@example.com', 'comment': f"comment {i}"})
+            assert response.status_code == 200, response.status_code
+            response.get_data()  # drain the streamed page
+
+        def chatSetup(client):
+            self.login(client)
+            socket = self.socketio.test_client(self.app, namespace='/chat', flask_test_client=client)
+            socket.emit('joined', {'room': 'bench'}, namespace='/chat')
+            socket.get_received('/chat')
+            return socket
+
+        def chat(client, socket, i):
+            socket.emit('message', {'msg': f"message {i}"}, namespace='/chat')
+            if i % 50 == 0:
+                socket.get_received('/chat')
+
+        return {
+            'GET /home': (None, get('/home')),
+            'GET /resume': (None, get('/resume')),
+            'GET /resume (logged in)': (self.login, get('/resume')),
+            'GET /feedback': (None, get('/feedback')),
+            'POST /processlogin': (None, login),
+            'POST /processfeedback': (None, feedback),
+            'socket.io /chat message': (chatSetup, chat),
+        }
+
+    def run(self, name, setup, request, clients=8, requests=400):
+        """
+        Run `requests` calls of one scenario spread over `clients` threads.
+
+        Returns:
+            dict: requests, throughput (req/s), p50/p95/p99/max latency (ms)
+                  and database statements per request.
+        """
+        per_client = max(1, requests // clients)
+        latencies = [[] for _ in range(clients)]
+        errors = []
+        states = []
+        for _ in range(clients):
+            client = self.app.test_client()
+            states.append((client, setup(client) if setup else None))
+
+        queries_before = self.metrics.query_seconds.total()
+        barrier = threading.Barrier(clients + 1)
+
+        def worker(n):
+            client, state = states[n]
+            barrier.wait()
+            for i in range(per_client):
+                start = time.perf_counter()
+                try:
+                    request(client, state, i)
+                except Exception as e:
+                    errors.append(repr(e))
+                latencies[n].append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        self._drainQueues()
+        queries = self.metrics.query_seconds.total() - queries_before
+
+        for client, state in states:
+            if hasattr(state, 'disconnect'):
+                state.disconnect(namespace='/chat')
+
+        samples = [value * 1000 for values in latencies for value in values]
+        return {
+            'scenario': name,
+            'requests': len(samples),
+            'errors': len(errors),
+            'throughput': round(len(samples) / elapsed, 1),
+            'p50_ms': round(_percentile(samples, 50), 3),
+            'p95_ms': round(_percentile(samples, 95), 3),
+            'p99_ms': round(_percentile(samples, 99), 3),
+            'max_ms': round(max(samples), 3),
+            'queries_per_request': round(queries / len(samples), 2),
+        }
+
+    def _drainQueues(self, timeout=10.0):
+        # Count the batched writes against the scenario that queued them
+        deadline = time.monotonic() + timeout
+        queues = [self.routes.feedback_queue, self.routes.chat_history._writer]
+        while time.monotonic() < deadline and any(queue.stats()['depth'] or queue._inflight for queue in queues):
+            time.sleep(0.01)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the regressions of `results` against a previous --save file: p95
+    latency more than `tolerance` (a fraction) higher, or more queries per request.
+    """
+    previous = {entry['scenario']: entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        before = previous.get(entry['scenario'])
+        if before is None:
+            continue
+        if entry['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{entry['scenario']}: p95 {before['p95_ms']} -> {entry['p95_ms']} ms")
+        if entry['queries_per_request'] > before['queries_per_request'] + 0.01:
+            regressions.append(f"{entry['scenario']}: queries/request {before['queries_per_request']} -> {entry['queries_per_request']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the hot request paths against an embedded database.')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients per scenario')
+    parser.add_argument('--requests', type=int, default=400, help='requests per scenario')
+    parser.add_argument('--scenario', action='append', help='only run scenarios containing this text')
+    parser.add_argument('--database-url', help='defaults to a temporary sqlite:// database')
+    parser.add_argument('--save', help='write the results as JSON')
+    parser.add_argument('--compare', help='JSON from a previous --save; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown for --compare')
+    args = parser.parse_args()
+
+    workdir = configure(args.database_url, args.clients)
+    bench = Bench()
+    results = []
+    print(f"{'scenario':28} {'requests':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries/req':>11} {'errors':>6}")
+    for name, (setup, request) in bench.scenarios().items():
+        if args.scenario and not any(text in name for text in args.scenario):
+            continue
+        bench.run(name, setup, request, clients=args.clients, requests=max(args.clients, args.requests // 10))  # warm up
+        result = bench.run(name, setup, request, clients=args.clients, requests=args.requests)
+        results.append(result)
+        print(f"{name:28} {result['requests']:>8} {result['throughput']:>9} {result['p50_ms']:>8} {result['p95_ms']:>8} "
+              f"{result['p99_ms']:>8} {result['queries_per_request']:>11} {result['errors']:>6}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+    sys.exit(1 if any(result['errors'] for result in results) else 0)
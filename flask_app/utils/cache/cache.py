@@ -0,0 +1,427 @@
+import os
+import stat
+import time
+import uuid
+import hashlib
+import atexit
+import pickle
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+from collections import OrderedDict
+
+
+def cacheDirectory():
+    """
+    Returns the directory used for caches shared between worker processes
+    (CACHE_DIR, or a folder in the system temp directory), creating it if needed.
+
+    Its files are trusted (some are unpickled), so the directory is created
+    with mode 0700 and refused unless it is owned by this user and closed to
+    everyone else.
+    """
+    directory = os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'personalsite-cache'))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.geteuid():
+        raise RuntimeError(f"Cache directory {directory} is not a directory owned by this user; set CACHE_DIR")
+    if info.st_mode & 0o077:
+        raise RuntimeError(f"Cache directory {directory} is accessible to other users; chmod 700 it or set CACHE_DIR")
+    return directory
+
+
+def atomicWrite(path, data):
+    """
+    Write `data` (bytes) to `path` so readers only ever see the old or the new file.
+    """
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class SharedSQLite:
+    """
+    One sqlite3 connection per process to a file shared by the workers on the
+    host, used by one caller at a time. (A thread-local connection would be
+    per greenlet under the eventlet worker, i.e. a new connection per request.)
+    The connection is reopened after fork() and closed at exit.
+
+    Args:
+        path (str): Database file.
+        setup (list): Statements run once per new connection (e.g. CREATE TABLE IF NOT EXISTS).
+    """
+
+    def __init__(self, path, setup=()):
+        self.path = path
+        self.setup = list(setup)
+        self._cnx = None
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields the process's connection (autocommit mode) for the duration of a `with` block.
+        """
+        with self._lock:
+            if self._cnx is None or self._pid != os.getpid():
+                # A connection inherited across fork() belongs to the parent; just drop it
+                cnx = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+                cnx.execute("PRAGMA journal_mode=WAL")
+                cnx.execute("PRAGMA synchronous=NORMAL")
+                for statement in self.setup:
+                    cnx.execute(statement)
+                self._cnx, self._pid = cnx, os.getpid()
+            yield self._cnx
+
+    def close(self):
+        with self._lock:
+            if self._cnx is not None and self._pid == os.getpid():
+                self._cnx.close()
+            self._cnx = None
+
+
+class VersionedCache:
+    """
+    A TTL cache that is shared between gunicorn workers through the filesystem.
+
+    Every cache has a version token stored in `<directory>/<name>.version`.
+    Values are kept in process memory and mirrored to a pickle file tagged
+    with the version that was current when they were loaded. Calling
+    `invalidate()` in any process writes a new token, which makes every copy
+    (local or on disk, in any worker) stale on its next read.
+
+    Args:
+        name (str): Cache name, used for the file names.
+        ttl (float): Seconds a value stays fresh even without invalidation.
+        directory (str): Where the shared files live (defaults to cacheDirectory()).
+    """
+
+    def __init__(self, name, ttl=300, directory=None):
+        self.name = name
+        self.ttl = ttl
+        self.directory = directory or cacheDirectory()
+        self.version_path = os.path.join(self.directory, f"{name}.version")
+
+        self._lock = threading.Lock()
+        self._local = {}
+        self._version = None
+        self._version_stat = None
+        self._stats = {'hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key, loader):
+        """
+        Returns the cached value for `key`, calling `loader()` to rebuild it on a miss.
+        """
+        version = self.version()
+        now = time.time()
+
+        entry = self._local.get(key)
+        if entry is not None and entry[0] == version and now - entry[1] < self.ttl:
+            self._stats['hits'] += 1
+            return entry[2]
+
+        entry = self._readShared(key)
+        if entry is not None and entry[0] == version and now - entry[1] < self.ttl:
+            self._stats['shared_hits'] += 1
+            self._local[key] = entry
+            return entry[2]
+
+        self._stats['misses'] += 1
+        # The version is read before loading, so a write that lands while we
+        # load leaves this entry tagged with the old token and it is discarded.
+        # Errors propagate uncached; an empty result is returned but not kept.
+        value = loader()
+        if value:
+            entry = (version, time.time(), value)
+            self._local[key] = entry
+            self._writeShared(key, entry)
+        return value
+
+    def invalidate(self):
+        """
+        Mark every cached value stale, in this process and in every other worker.
+        """
+        with self._lock:
+            self._local.clear()
+            atomicWrite(self.version_path, uuid.uuid4().hex.encode())
+            self._version_stat = None
+            self._stats['invalidations'] += 1
+
+    def version(self):
+        """
+        Returns the current shared version token. The token file is only
+        re-read when its stat signature changes.
+        """
+        try:
+            st = os.stat(self.version_path)
+        except FileNotFoundError:
+            self.invalidate()
+            st = os.stat(self.version_path)
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if signature != self._version_stat:
+            with open(self.version_path, 'rb') as f:
+                self._version = f.read().decode()
+            self._version_stat = signature
+        return self._version
+
+    def stats(self):
+        """
+        Returns the hit/miss counters for this process.
+        """
+        stats = dict(self._stats)
+        stats['entries'] = len(self._local)
+        return stats
+
+    def _sharedPath(self, key):
+        return os.path.join(self.directory, f"{self.name}.{key}.pickle")
+
+    def _readShared(self, key):
+        try:
+            with open(self._sharedPath(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _writeShared(self, key, entry):
+        try:
+            atomicWrite(self._sharedPath(key), pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        except (OSError, pickle.PicklingError):
+            # The in-process copy still works; other workers will just miss.
+            pass
+
+
+class LRUCache:
+    """
+    A bounded in-process mapping that evicts the least recently used entry,
+    with an optional per-entry time to live.
+
+    Args:
+        maxsize (int): Maximum number of entries.
+        ttl (float): Seconds an entry stays valid (None for no expiry).
+    """
+
+    _missing = object()
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, self._missing)
+            if entry is self._missing or (self.ttl is not None and time.monotonic() - entry[0] > self.ttl):
+                if entry is not self._missing:
+                    del self._data[key]
+                self._stats['misses'] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        Returns the hit/miss/eviction counters.
+        """
+        stats = dict(self._stats)
+        stats['entries'] = len(self._data)
+        return stats
+
+
+class PageCache:
+    """
+    Rendered responses keyed by (route, variant), each with a strong ETag.
+
+    Entries are tagged with the token returned by `version()` when they were
+    rendered (e.g. VersionedCache.version of the data behind the pages), so
+    bumping that token re-renders every page on its next request.
+
+    Args:
+        version (callable): Returns the current version token (None: never changes).
+        maxsize (int): Maximum number of cached pages.
+        ttl (float): Seconds a page stays valid (None for no expiry).
+    """
+
+    def __init__(self, version=None, maxsize=256, ttl=None):
+        self.version = version or (lambda: None)
+        self._pages = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key, render):
+        """
+        Returns (body, etag) for `key`, calling `render()` (returning str or bytes) on a miss.
+        """
+        version = self.version()
+        entry = self._pages.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1], entry[2]
+        body = render()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        self._pages.set(key, (version, body, etag))
+        return body, etag
+
+    def invalidate(self):
+        """
+        Drop every page cached by this process.
+        """
+        self._pages.clear()
+
+    def stats(self):
+        """
+        Returns the hit/miss/eviction counters.
+        """
+        return self._pages.stats()
+
+
+def freeze(value):
+    """
+    Returns a read-only copy of nested dicts/lists (MappingProxyType/tuple).
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class Snapshot:
+    """
+    A single read-only value compiled once and shared by every worker.
+
+    The value is pickled to `<directory>/<name>.snapshot` tagged with the
+    `version()` token it was built under; a worker loads the file if its tag
+    is current and only rebuilds (and rewrites the file) otherwise. Reads
+    return the in-memory object itself and look at the version token at most
+    every `interval` seconds, so a hit does no I/O and takes no lock. A new
+    value replaces the old one in a single assignment, so readers see one
+    or the other, never a mix.
+
+    A snapshot older than `max_age` seconds is rebuilt even if the version
+    did not move. If `build()` raises, the previous snapshot (if any) keeps
+    being served and the build is retried at the next check. Empty builds
+    are served but never written to the file, and are retried at the next
+    check too.
+
+    Args:
+        name (str): Used for the file name.
+        version (callable): Returns the current version token.
+        interval (float): Seconds between version checks.
+        max_age (float): Seconds after which a snapshot is rebuilt regardless.
+        directory (str): Where the snapshot file lives (defaults to cacheDirectory()).
+    """
+
+    def __init__(self, name, version, interval=1.0, max_age=3600.0, directory=None):
+        self.name = name
+        self.version = version
+        self.interval = interval
+        self.max_age = max_age
+        self.directory = directory or cacheDirectory()
+        self.path = os.path.join(self.directory, f"{name}.snapshot")
+        self._current = None  # (version, built_at, frozen value)
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'loads': 0, 'builds': 0, 'build_errors': 0}
+
+    def _fresh(self, entry, version):
+        return entry is not None and entry[0] == version and time.time() - entry[1] < self.max_age
+
+    def get(self, build):
+        """
+        Returns the snapshot, loading it from disk or calling `build()` when the version moved on.
+        """
+        current = self._current
+        now = time.monotonic()
+        if current is not None and now - self._checked < self.interval:
+            self._stats['hits'] += 1
+            return current[2]
+
+        version = self.version()
+        self._checked = now
+        if self._fresh(current, version):
+            self._stats['hits'] += 1
+            return current[2]
+        return self.refresh(build, version)
+
+    def refresh(self, build, version=None):
+        """
+        Replace the snapshot for `version` (default: the current token), reusing the file if another worker built it.
+        """
+        version = version or self.version()
+        with self._lock:
+            if self._fresh(self._current, version):
+                return self._current[2]
+            try:
+                with open(self.path, 'rb') as f:
+                    stored = pickle.load(f)
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+                stored = None
+            if not (isinstance(stored, tuple) and len(stored) == 3):
+                stored = None
+
+            if self._fresh(stored, version):
+                self._stats['loads'] += 1
+                self._current = (version, stored[1], freeze(stored[2]))
+                return self._current[2]
+
+            # Built under the version read above; a write landing meanwhile bumps it again
+            try:
+                value = build()
+            except Exception:
+                self._stats['build_errors'] += 1
+                if self._current is None:
+                    raise
+                return self._current[2]
+            self._stats['builds'] += 1
+            built_at = time.time()
+            if value:
+                try:
+                    atomicWrite(self.path, pickle.dumps((version, built_at, value), protocol=pickle.HIGHEST_PROTOCOL))
+                except (OSError, pickle.PicklingError):
+                    pass
+            else:
+                # Most likely the data is missing rather than empty; don't let it stick
+                version = None
+            self._current = (version, built_at, freeze(value))
+            return self._current[2]
+
+    def stats(self):
+        """
+        Returns hit/load/build counters for this process.
+        """
+        return dict(self._stats)
@@ -0,0 +1,98 @@
+import os
+import time
+import argparse
+from .coalesce import Coalescer
+
+
+def _room(room_size):
+    """
+    A Flask-SocketIO server with `room_size` test clients joined to the
+    'main' room of /chat. Test clients go through the real server: sessions,
+    rooms and packet encoding per client; only the transport is in memory.
+    """
+    from flask import Flask
+    from flask_socketio import SocketIO, join_room
+
+    app = Flask(__name__)
+    socketio = SocketIO(app, async_mode='threading')
+
+    @socketio.on('joined', namespace='/chat')
+    def joined(message):
+        join_room('main')
+
+    clients = []
+    for _ in range(room_size):
+        client = socketio.test_client(app, namespace='/chat')
+        client.emit('joined', {}, namespace='/chat')
+        client.get_received('/chat')
+        clients.append(client)
+    return socketio, clients
+
+
+def _received(clients):
+    # Frames delivered since the last call (draining the clients' queues)
+    return sum(len(client.get_received('/chat')) for client in clients)
+
+
+def run(room_size, messages_per_sec=200, seconds=2.0, interval=0.05, max_batch=50):
+    """
+    Simulate `seconds` of a room receiving `messages_per_sec` chat messages
+    on a real Socket.IO server with `room_size` connected clients, once
+    emitting every message immediately and once through a Coalescer flushed
+    every `interval` seconds of simulated time. Only the emits and flushes
+    are timed; counting the frames the clients received is not.
+
+    Returns:
+        dict: Frames received and CPU seconds spent for each mode.
+    """
+    total = int(messages_per_sec * seconds)
+    per_window = max(1, int(messages_per_sec * interval))
+    payload = {'msg': 'Guest (Guest): hello there, how is everyone doing?', 'class': 'user-message'}
+    result = {'room_size': room_size, 'messages': total}
+    socketio, clients = _room(room_size)
+
+    frames, cpu = 0, 0.0
+    for i in range(total):
+        start = time.process_time()
+        socketio.emit('status', payload, to='main', namespace='/chat')
+        cpu += time.process_time() - start
+        if (i + 1) % per_window == 0:
+            frames += _received(clients)
+    frames += _received(clients)
+    result['immediate_frames'] = frames
+    result['immediate_cpu_s'] = round(cpu, 4)
+
+    coalescer = Coalescer(socketio, interval=interval, max_batch=max_batch)
+    coalescer._pid = os.getpid()  # flushed by hand below, no background task
+    frames, cpu = 0, 0.0
+    for i in range(total):
+        start = time.process_time()
+        coalescer.emit('status', payload, 'main')
+        if (i + 1) % per_window == 0:
+            coalescer.flush()
+        cpu += time.process_time() - start
+        if (i + 1) % per_window == 0:
+            frames += _received(clients)
+    start = time.process_time()
+    coalescer.flush()
+    cpu += time.process_time() - start
+    frames += _received(clients)
+    result['coalesced_frames'] = frames
+    result['coalesced_cpu_s'] = round(cpu, 4)
+
+    for client in clients:
+        client.disconnect(namespace='/chat')
+    result['frames_per_sec_immediate'] = int(result['immediate_frames'] / seconds)
+    result['frames_per_sec_coalesced'] = int(result['coalesced_frames'] / seconds)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare immediate and coalesced chat broadcasts on a Socket.IO server.')
+    parser.add_argument('--room-sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--rate', type=int, default=200, help='messages per second in the room')
+    parser.add_argument('--interval-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    for size in args.room_sizes:
+        print(run(size, messages_per_sec=args.rate, interval=args.interval_ms / 1000))
@@ -0,0 +1,176 @@
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+from urllib.parse import urlparse
+from socketio import PubSubManager
+
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    """
+    A minimal fan-out message broker: every newline-delimited message a
+    client sends is forwarded to every subscribed client (the sender too;
+    Socket.IO managers skip their own messages by host id). A connection
+    subscribes by sending SUBSCRIBE as its first line.
+
+    It stands in for Redis/RabbitMQ on a single host or in tests. Run it
+    with `python -m flask_app.utils.chat.broker --port 5557` and point every
+    worker at it with SOCKETIO_MESSAGE_QUEUE=local://127.0.0.1:5557.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=5557):
+        # subscriber socket -> lock, so lines from concurrent publishers never interleave
+        self.subscribers = {}
+        self.subscribers_lock = threading.Lock()
+        super().__init__((host, port), _BrokerHandler)
+
+    def publish(self, line):
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers.items())
+        for subscriber, lock in subscribers:
+            try:
+                with lock:
+                    subscriber.sendall(line)
+            except OSError:
+                with self.subscribers_lock:
+                    self.subscribers.pop(subscriber, None)
+
+
+SUBSCRIBE = b"SUBSCRIBE\n"
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            for line in self.rfile:
+                if line == SUBSCRIBE:
+                    with self.server.subscribers_lock:
+                        self.server.subscribers[self.request] = threading.Lock()
+                else:
+                    self.server.publish(line)
+        finally:
+            with self.server.subscribers_lock:
+                self.server.subscribers.pop(self.request, None)
+
+
+class LocalBrokerManager(PubSubManager):
+    """
+    Socket.IO client manager that shares emits, room changes and disconnects
+    between processes through a LocalBroker.
+
+    Args:
+        url (str): 'local://host:port' of the broker.
+        channel (str): Only messages on this channel are delivered.
+    """
+
+    name = 'local'
+
+    def __init__(self, url='local://127.0.0.1:5557', channel='flask-socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 5557)
+        self._sock = None
+        self._send_lock = threading.Lock()
+
+    def _connect(self):
+        if self._sock is None:
+            self._sock = socket.create_connection(self.address)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self._sock
+
+    def _publish(self, data):
+        line = (json.dumps({'channel': self.channel, 'data': data}) + "\n").encode()
+        with self._send_lock:
+            for attempt in range(2):
+                try:
+                    self._connect().sendall(line)
+                    return
+                except OSError:
+                    self._reset()
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        # Subscribe on a separate connection so publishing never has to share
+        # a socket with the blocking reader.
+        delay = 0.5
+        while True:
+            sock = None
+            try:
+                sock = socket.create_connection(self.address)
+                sock.sendall(SUBSCRIBE)
+                delay = 0.5
+                for line in sock.makefile('rb'):
+                    message = json.loads(line)
+                    if message.get('channel') == self.channel:
+                        yield message['data']
+            except (OSError, ValueError):
+                pass
+            finally:
+                if sock is not None:
+                    sock.close()
+            # The broker went away; back off and reconnect.
+            time.sleep(delay)
+            delay = min(delay * 2, 10)
+
+    def _reset(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+
+def clientManagerFromUrl(url, channel='flask-socketio'):
+    """
+    Returns the Socket.IO init options for a message queue URL: a
+    LocalBrokerManager for local://, or message_queue=url so Flask-SocketIO
+    picks its own Redis/Kombu/Kafka/ZMQ backend. Returns {} for no URL.
+    """
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': LocalBrokerManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the local Socket.IO fan-out broker.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5557)
+    args = parser.parse_args()
+
+    broker = LocalBroker(args.host, args.port)
+    print(f"Local broker listening on {args.host}:{args.port}")
+    broker.serve_forever()
+
+
+def onRemoteEmit(manager, callback):
+    """
+    Call `callback(message)` for every emit another process publishes on the
+    message queue, before it is delivered to this process's clients. The
+    message is a dict with 'event', 'data', 'namespace' and 'room'.
+
+    Returns:
+        bool: False if `manager` does not use a message queue (nothing to follow).
+    """
+    if not isinstance(manager, PubSubManager):
+        return False
+    handle = manager._handle_emit
+
+    def _handle_emit(message):
+        try:
+            callback(message)
+        except Exception:
+            manager._get_logger().exception('remote emit callback failed')
+        return handle(message)
+
+    manager._handle_emit = _handle_emit
+    return True
@@ -0,0 +1,86 @@
+import os
+import threading
+from ..logs.logs import getLogger
+
+log = getLogger(__name__)
+
+
+class Coalescer:
+    """
+    Groups events emitted to a room within a short window into one 'batch'
+    event, so a busy room costs one frame per client per window instead of
+    one frame per message.
+
+    A background task (started on first use, in the worker process) flushes
+    every `interval` seconds; a room is also flushed as soon as it has
+    `max_batch` pending events. Clients receive
+    `batch` = {'events': [{'event': name, 'data': payload}, ...]} and replay
+    each entry through their normal handlers.
+
+    Args:
+        socketio: The Flask-SocketIO instance used to emit.
+        namespace (str): Namespace the events belong to.
+        interval (float): Flush window in seconds.
+        max_batch (int): Events per room that trigger an immediate flush.
+    """
+
+    def __init__(self, socketio, namespace='/chat', interval=0.05, max_batch=50):
+        self.socketio = socketio
+        self.namespace = namespace
+        self.interval = interval
+        self.max_batch = max_batch
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stats = {'events': 0, 'batches': 0}
+
+    def emit(self, event, data, room):
+        """
+        Queue `event` for `room`; it is delivered with the next flush.
+        """
+        self._ensureStarted()
+        with self._lock:
+            pending = self._pending.setdefault(room, [])
+            pending.append({'event': event, 'data': data})
+            full = len(pending) >= self.max_batch
+        self._stats['events'] += 1
+        if full:
+            self.flush(room)
+
+    def flush(self, room=None):
+        """
+        Send the pending events of `room` (or of every room) now.
+        """
+        with self._lock:
+            if room is None:
+                batches, self._pending = self._pending, {}
+            else:
+                batches = {room: self._pending.pop(room, [])}
+        for target, events in batches.items():
+            if not events:
+                continue
+            self._stats['batches'] += 1
+            self.socketio.emit('batch', {'events': events}, to=target, namespace=self.namespace)
+
+    def stats(self):
+        """
+        Returns the number of events queued and batches sent by this process.
+        """
+        return dict(self._stats)
+
+    def _ensureStarted(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("chat coalescer flush failed", extra={'error': str(e)})
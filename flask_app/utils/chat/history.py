@@ -0,0 +1,132 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from ..writebehind.writebehind import WriteBehindQueue
+
+CHAT_COLUMNS = ['room', 'sent_at', 'msg', 'msg_class']
+
+
+class ChatHistory:
+    """
+    Recent chat messages per room, kept in memory for instant backfill and
+    persisted to `chat_messages` in batches.
+
+    Each room has a ring buffer of its last `size` messages, filled from the
+    database the first time the room is touched in this process. At most
+    `max_rooms` buffers are kept; the least recently used room is dropped
+    first and simply reloads from the database next time. Writes go through
+    a WriteBehindQueue, so sending a message never waits on the database.
+
+    Messages are dicts {'msg', 'class', 'sent_at'}; `sent_at` (microseconds
+    since the epoch) doubles as the cursor for paging older history.
+
+    With several workers, messages appended elsewhere reach this process
+    only through the Socket.IO message queue; pass them to receive() so the
+    buffers don't miss them.
+
+    Args:
+        db: The `database` instance.
+        size (int): Messages kept per room.
+        max_rooms (int): Rooms kept in memory.
+    """
+
+    def __init__(self, db, size=50, max_rooms=100, batch_size=100, interval=0.5):
+        self.db = db
+        self.size = size
+        self.max_rooms = max_rooms
+        self._rooms = OrderedDict()
+        self._lock = threading.Lock()
+        self._writer = WriteBehindQueue(
+            flush=lambda rows: db.insertRows(table='chat_messages', columns=CHAT_COLUMNS, parameters=rows),
+            name='chat',
+            batch_size=batch_size,
+            interval=interval
+        )
+
+    def append(self, room, msg, msg_class):
+        """
+        Record a message and queue it for persistence.
+
+        Returns:
+            dict: The stored message.
+        """
+        message = {'msg': msg, 'class': msg_class, 'sent_at': time.time_ns() // 1000}
+        self._buffer(room).append(message)
+        self._writer.submit([room, message['sent_at'], msg, msg_class])
+        return message
+
+    def receive(self, room, message):
+        """
+        Add a message another worker appended to `room` (as broadcast, with
+        its 'sent_at') to the buffer, if this process has the room buffered.
+        Rooms that are not buffered pick it up from the database on backfill.
+
+        Returns:
+            bool: True if the message was added.
+        """
+        entry = {'msg': message['msg'], 'class': message['class'], 'sent_at': message['sent_at']}
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is None or any(m['sent_at'] == entry['sent_at'] for m in buffer):
+                return False
+            if not buffer or buffer[-1]['sent_at'] < entry['sent_at']:
+                buffer.append(entry)
+                return True
+            # Arrived out of order (clocks, queue latency): keep the buffer sorted
+            if len(buffer) == buffer.maxlen and entry['sent_at'] < buffer[0]['sent_at']:
+                return False
+            messages = sorted([*buffer, entry], key=lambda m: m['sent_at'])
+            buffer.clear()
+            buffer.extend(messages)
+        return True
+
+    def recent(self, room):
+        """
+        Returns the buffered messages for `room`, oldest first.
+        """
+        return list(self._buffer(room))
+
+    def older(self, room, before, limit=50):
+        """
+        Returns up to `limit` messages sent before the `before` cursor, oldest first.
+        """
+        rows = self.db.getChatHistory(room, before=before, limit=limit, rows='namedtuple')
+        return [self._fromRow(row) for row in reversed(rows)]
+
+    def stats(self):
+        """
+        Returns buffer occupancy and the persistence queue metrics.
+        """
+        with self._lock:
+            buffered = sum(len(buffer) for buffer in self._rooms.values())
+            rooms = len(self._rooms)
+        return {'rooms': rooms, 'buffered': buffered, 'writer': self._writer.stats()}
+
+    def _buffer(self, room):
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is not None:
+                self._rooms.move_to_end(room)
+                return buffer
+
+        # Backfill outside the lock; messages still waiting in the write
+        # queue are not in the database yet, so merge them in too.
+        rows = self.db.getChatHistory(room, limit=self.size, rows='namedtuple')
+        messages = [self._fromRow(row) for row in reversed(rows)]
+        seen = {m['sent_at'] for m in messages}
+        for pending in self._writer.pending():
+            if pending[0] == room and pending[1] not in seen:
+                messages.append({'msg': pending[2], 'class': pending[3], 'sent_at': pending[1]})
+
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is None:
+                buffer = deque(messages, maxlen=self.size)
+                self._rooms[room] = buffer
+                while len(self._rooms) > self.max_rooms:
+                    self._rooms.popitem(last=False)
+            return buffer
+
+    @staticmethod
+    def _fromRow(row):
+        return {'msg': row.msg, 'class': row.msg_class, 'sent_at': row.sent_at}
@@ -0,0 +1,152 @@
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+from .broker import LocalBroker, LocalBrokerManager
+
+
+def _server(url, port):
+    """
+    One Socket.IO server process standing in for a gunicorn eventlet worker:
+    clients join the 'main' room and every 'message' is broadcast to it
+    through the LocalBroker, as the chat routes do. Started by _startServer(),
+    which has already monkey-patched the process.
+    """
+    import eventlet
+    import socketio
+    from eventlet import wsgi
+
+    sio = socketio.Server(async_mode='eventlet', client_manager=LocalBrokerManager(url))
+
+    @sio.on('joined', namespace='/chat')
+    def joined(sid, data):
+        sio.enter_room(sid, 'main', namespace='/chat')
+        return True
+
+    @sio.on('message', namespace='/chat')
+    def message(sid, data):
+        sio.emit('status', data, to='main', namespace='/chat')
+
+    listener = eventlet.listen(('127.0.0.1', port))
+    wsgi.server(listener, socketio.WSGIApp(sio), log_output=False)
+
+
+def _startServer(url, port):
+    # A fresh interpreter that patches before anything imports flask_app
+    # (which pulls in Flask and Socket.IO), as gunicorn's eventlet worker does
+    code = ("import eventlet; eventlet.monkey_patch(); "
+            "from flask_app.utils.chat.loadtest import _server; "
+            f"_server({url!r}, {port})")
+    return subprocess.Popen([sys.executable, '-c', code])
+
+
+def _freePort():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _waitForPort(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(workers=3, clients=4, messages=200, timeout=10.0):
+    """
+    Measure end-to-end broadcast latency across worker processes: start
+    `workers` Socket.IO server processes sharing a LocalBroker, connect
+    `clients` python-socketio clients to each, and send `messages` chat
+    messages one at a time (rotating the sending client, so every worker
+    originates some). Each message is timed from emit until every client,
+    on every worker, has received it.
+
+    Requires the Socket.IO client: pip install "python-socketio[client]".
+
+    Returns:
+        dict: Complete deliveries plus p50/p95/p99/max latency in milliseconds.
+    """
+    import socketio
+
+    broker = LocalBroker('127.0.0.1', 0)
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+    url = f"local://127.0.0.1:{broker.server_address[1]}"
+
+    ports = [_freePort() for _ in range(workers)]
+    procs = [_startServer(url, port) for port in ports]
+
+    lock = threading.Lock()
+    counts = {}
+    done = threading.Event()
+    total = workers * clients
+
+    def received(data):
+        with lock:
+            counts[data['seq']] = counts.get(data['seq'], 0) + 1
+            if counts[data['seq']] == total:
+                done.set()
+
+    connected = []
+    try:
+        for port in ports:
+            _waitForPort(port)
+        for i in range(total):
+            client = socketio.Client()
+            client.on('status', received, namespace='/chat')
+            client.connect(f"http://127.0.0.1:{ports[i % workers]}", namespaces=['/chat'], transports=['websocket'])
+            client.call('joined', {}, namespace='/chat', timeout=timeout)
+            connected.append(client)
+
+        # Every server subscribes to the broker on its first connection
+        while len(broker.subscribers) < workers:
+            time.sleep(0.01)
+
+        latencies = []
+        for seq in range(messages):
+            done.clear()
+            start = time.perf_counter()
+            connected[seq % total].emit('message', {'msg': 'hello', 'seq': seq}, namespace='/chat')
+            if done.wait(timeout):
+                latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        for client in connected:
+            client.disconnect()
+        for proc in procs:
+            proc.terminate()
+            proc.wait(5)
+        broker.shutdown()
+
+    return {
+        'workers': workers,
+        'clients': total,
+        'delivered': len(latencies),
+        'lost': messages - len(latencies),
+        'p50_ms': round(_percentile(latencies, 50), 3) if latencies else None,
+        'p95_ms': round(_percentile(latencies, 95), 3) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 99), 3) if latencies else None,
+        'max_ms': round(max(latencies), 3) if latencies else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Chat broadcast latency across Socket.IO worker processes via the local broker.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 3, 6])
+    parser.add_argument('--clients', type=int, default=4, help='clients connected to each worker')
+    parser.add_argument('--messages', type=int, default=200)
+    args = parser.parse_args()
+
+    for count in args.workers:
+        print(run(workers=count, clients=args.clients, messages=args.messages))
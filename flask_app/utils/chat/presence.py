@@ -0,0 +1,186 @@
+import os
+import time
+import secrets
+import threading
+from ..cache.cache import cacheDirectory, SharedSQLite
+
+
+class SharedRoster:
+    """
+    Room membership shared by the workers on the host through a SQLite file,
+    so every worker lists the same members for a room. Rows belong to the
+    worker that added them; a worker that stops sending heartbeat() for
+    `timeout` seconds (crashed or killed) has its rows dropped.
+
+    Args:
+        path (str): Database file (defaults to presence.sqlite3 in cacheDirectory()).
+        timeout (float): Seconds without a heartbeat before a worker's members are dropped.
+    """
+
+    def __init__(self, path=None, timeout=180.0):
+        self.path = path or os.path.join(cacheDirectory(), 'presence.sqlite3')
+        self.timeout = timeout
+        self._worker = None
+        self._pid = None
+        self.db = SharedSQLite(self.path, setup=[
+            "CREATE TABLE IF NOT EXISTS presence (sid TEXT PRIMARY KEY, room TEXT NOT NULL, user TEXT NOT NULL, "
+            "role TEXT NOT NULL, worker TEXT NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS idx_presence_room ON presence (room)",
+            "CREATE TABLE IF NOT EXISTS workers (worker TEXT PRIMARY KEY, seen REAL NOT NULL)",
+        ])
+
+    @property
+    def worker(self):
+        # A new id after fork(), so parent and child don't share rows
+        if self._pid != os.getpid():
+            self._worker, self._pid = f"{os.getpid()}-{secrets.token_hex(4)}", os.getpid()
+        return self._worker
+
+    def add(self, sid, room, user, role):
+        with self.db.connection() as cnx:
+            cnx.execute("INSERT OR REPLACE INTO workers (worker, seen) VALUES (?, ?)", (self.worker, time.time()))
+            cnx.execute("INSERT OR REPLACE INTO presence (sid, room, user, role, worker) VALUES (?, ?, ?, ?, ?)",
+                        (sid, room, user, role, self.worker))
+
+    def remove(self, sid):
+        with self.db.connection() as cnx:
+            cnx.execute("DELETE FROM presence WHERE sid = ?", (sid,))
+
+    def members(self, room):
+        """
+        Returns [{'user', 'role'}, ...] for everyone in `room` on any live worker, sorted by name.
+        """
+        with self.db.connection() as cnx:
+            rows = cnx.execute(
+                "SELECT p.user, p.role FROM presence p JOIN workers w ON w.worker = p.worker "
+                "WHERE p.room = ? AND w.seen > ? ORDER BY p.user",
+                (room, time.time() - self.timeout)
+            ).fetchall()
+        return [{'user': user, 'role': role} for user, role in rows]
+
+    def heartbeat(self):
+        """
+        Mark this worker alive and drop the members of workers that are not.
+        """
+        now = time.time()
+        with self.db.connection() as cnx:
+            cnx.execute("INSERT OR REPLACE INTO workers (worker, seen) VALUES (?, ?)", (self.worker, now))
+            cnx.execute("DELETE FROM presence WHERE worker IN (SELECT worker FROM workers WHERE seen <= ?)",
+                        (now - self.timeout,))
+            cnx.execute("DELETE FROM workers WHERE seen <= ?", (now - self.timeout,))
+
+    def close(self):
+        self.db.close()
+
+
+class PresenceRegistry:
+    """
+    Tracks who is connected to which chat room in this worker.
+
+    Two indexes are kept in step, room -> set of sids and sid -> member
+    record, so join, leave, disconnect and membership lookups are all O(1)
+    (listing a room is O(members)). Each record remembers when the client
+    was last active so idle connections can be reaped.
+
+    With several workers each registry only sees its own connections, so
+    pass a SharedRoster: joins and leaves are mirrored to it and members()
+    lists the room across all workers. The connection-level lookups
+    (member, touch, idle) stay local, since a connection's events are
+    always handled by its own worker.
+
+    Args:
+        roster (SharedRoster): Optional membership shared between workers.
+    """
+
+    def __init__(self, roster=None):
+        self.roster = roster
+        self._rooms = {}
+        self._members = {}
+        self._lock = threading.Lock()
+
+    def join(self, sid, room, user, role):
+        """
+        Put `sid` in `room`, leaving the room it was in before (one room per connection).
+
+        Returns:
+            str: The previous room, or None.
+        """
+        with self._lock:
+            member = self._members.get(sid)
+            previous = member['room'] if member else None
+            if previous is not None and previous != room:
+                self._discard(sid, previous)
+            self._members[sid] = {'user': user, 'role': role, 'room': room, 'last_seen': time.monotonic()}
+            self._rooms.setdefault(room, set()).add(sid)
+        if self.roster is not None:
+            self.roster.add(sid, room, user, role)
+        return previous if previous != room else None
+
+    def leave(self, sid):
+        """
+        Remove `sid` from its room and forget it.
+
+        Returns:
+            dict: The member record ({'user', 'role', 'room', 'last_seen'}), or None if unknown.
+        """
+        with self._lock:
+            member = self._members.pop(sid, None)
+            if member is not None:
+                self._discard(sid, member['room'])
+        if member is not None and self.roster is not None:
+            self.roster.remove(sid)
+        return member
+
+    def member(self, sid):
+        """
+        Returns the member record for `sid`, or None.
+        """
+        return self._members.get(sid)
+
+    def touch(self, sid):
+        """
+        Mark `sid` as active now.
+        """
+        member = self._members.get(sid)
+        if member is not None:
+            member['last_seen'] = time.monotonic()
+
+    def members(self, room):
+        """
+        Returns [{'user', 'role'}, ...] for everyone in `room`, sorted by name.
+        """
+        if self.roster is not None:
+            return self.roster.members(room)
+        with self._lock:
+            sids = list(self._rooms.get(room, ()))
+            members = [self._members[sid] for sid in sids if sid in self._members]
+        return sorted(({'user': m['user'], 'role': m['role']} for m in members), key=lambda m: m['user'])
+
+    def idle(self, timeout):
+        """
+        Returns the sids that have not been active for `timeout` seconds.
+        """
+        cutoff = time.monotonic() - timeout
+        with self._lock:
+            return [sid for sid, member in self._members.items() if member['last_seen'] < cutoff]
+
+    def heartbeat(self):
+        """
+        Keep this worker's entries in the shared roster alive; call periodically.
+        """
+        if self.roster is not None:
+            self.roster.heartbeat()
+
+    def stats(self):
+        """
+        Returns the number of rooms and connections tracked in this worker.
+        """
+        with self._lock:
+            return {'rooms': len(self._rooms), 'connections': len(self._members)}
+
+    def _discard(self, sid, room):
+        sids = self._rooms.get(room)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._rooms[room]
@@ -0,0 +1,146 @@
+import os
+import sys
+import hmac
+import time
+import hashlib
+import secrets
+import argparse
+
+# Stored format: scrypt$<n>$<r>$<p>$<salt hex>$<hash hex>
+SCHEME = 'scrypt'
+SALT_BYTES = 16
+HASH_BYTES = 64
+
+
+def configuredParams(defaults=None):
+    """
+    Returns the scrypt cost parameters from SCRYPT_N / SCRYPT_R / SCRYPT_P,
+    falling back to `defaults` (a dict with 'n', 'r' and 'p').
+    """
+    defaults = defaults or {'n': 2**14, 'r': 8, 'p': 1}
+    return {
+        'n': int(os.environ.get('SCRYPT_N', defaults['n'])),
+        'r': int(os.environ.get('SCRYPT_R', defaults['r'])),
+        'p': int(os.environ.get('SCRYPT_P', defaults['p'])),
+    }
+
+
+def _scrypt(password, salt, n, r, p):
+    # scrypt needs about 128 * r * (n + p) bytes; OpenSSL's default 32 MiB cap is too low for larger n.
+    maxmem = 128 * r * (n + p + 2) + 2**20
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=HASH_BYTES)
+
+
+def hashPassword(password, n, r, p, salt=None):
+    """
+    Hash `password` with a fresh random salt.
+
+    Returns:
+        str: 'scrypt$n$r$p$salt$hash', with the parameters and salt needed to verify it.
+    """
+    salt = salt or secrets.token_bytes(SALT_BYTES)
+    digest = _scrypt(password, salt, n, r, p)
+    return f"{SCHEME}${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+
+def isLegacy(stored):
+    """
+    Returns True for hashes written before per-user salts (bare hex, global salt).
+    """
+    return not stored.startswith(SCHEME + '$')
+
+
+def verifyPassword(password, stored, legacy=None):
+    """
+    Check `password` against a stored hash in constant time.
+
+    Args:
+        password (str): The candidate password.
+        stored (str): A value produced by hashPassword(), or a legacy hex hash.
+        legacy (dict): {'salt', 'n', 'r', 'p'} used to check legacy hashes.
+
+    Returns:
+        bool: True if the password matches.
+    """
+    if isLegacy(stored):
+        if legacy is None:
+            return False
+        candidate = _scrypt(password, legacy['salt'], legacy['n'], legacy['r'], legacy['p']).hex()
+        return hmac.compare_digest(candidate, stored)
+
+    try:
+        _, n, r, p, salt, digest = stored.split('$')
+        candidate = _scrypt(password, bytes.fromhex(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(candidate.hex(), digest)
+
+
+def needsRehash(stored, n, r, p):
+    """
+    Returns True if `stored` is a legacy hash or uses different cost parameters.
+    """
+    if isLegacy(stored):
+        return True
+    parts = stored.split('$')
+    return parts[1:4] != [str(n), str(r), str(p)]
+
+
+def _eventletPatched():
+    eventlet = sys.modules.get('eventlet')
+    if eventlet is None:
+        return False
+    from eventlet import patcher
+    return patcher.is_monkey_patched('thread')
+
+
+def offload(func, *args, **kwargs):
+    """
+    Run a CPU-bound call without stalling the event loop.
+
+    Under the eventlet worker the call is handed to eventlet's native thread
+    pool (tpool), so other greenlets, including chat sockets, keep running
+    while it hashes. hashlib.scrypt releases the GIL, so in a plain threaded
+    server calling it directly already lets other threads run.
+    """
+    if _eventletPatched():
+        from eventlet import tpool
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+def calibrate(target_ms=100, r=8, p=1, max_n=2**20, samples=3):
+    """
+    Find the largest power-of-two n whose hash time on this host stays within `target_ms`.
+
+    Returns:
+        dict: {'n', 'r', 'p', 'ms'} for the chosen parameters.
+    """
+    best = None
+    n = 2**10
+    while n <= max_n:
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            _scrypt('calibration-password', secrets.token_bytes(SALT_BYTES), n, r, p)
+            timings.append((time.perf_counter() - start) * 1000)
+        ms = sorted(timings)[len(timings) // 2]
+        if ms > target_ms and best is not None:
+            break
+        best = {'n': n, 'r': r, 'p': p, 'ms': round(ms, 2)}
+        if ms > target_ms:
+            break
+        n *= 2
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pick scrypt parameters that hit a target hashing latency on this host.')
+    parser.add_argument('--target-ms', type=float, default=100, help='target time per hash in milliseconds')
+    parser.add_argument('-r', type=int, default=8, help='block size factor')
+    parser.add_argument('-p', type=int, default=1, help='parallelization factor')
+    args = parser.parse_args()
+
+    result = calibrate(target_ms=args.target_ms, r=args.r, p=args.p)
+    print(f"n={result['n']} r={result['r']} p={result['p']} takes {result['ms']} ms per hash")
+    print(f"export SCRYPT_N={result['n']} SCRYPT_R={result['r']} SCRYPT_P={result['p']}")
@@ -1,23 +1,39 @@
 import os
+import re
 import sys
 import glob
 import json
 import csv
 from io import StringIO
+from contextlib import contextmanager
 import itertools
+import collections
 import datetime
+import time
 import hashlib
-from cryptography.fernet import Fernet
+import secrets
+import logging
+from functools import lru_cache
+from ..crypto import crypto
+from ..crypto import passwords
+from ..metrics import metrics
+from ..logs.logs import getLogger
+from .pool import getPool, PoolTimeout
+from . import green
+from . import sqlite as sqlite_backend
+from ..cache.cache import VersionedCache, LRUCache, Snapshot
+
+log = getLogger(__name__)
 
 # Import database connectors based on environment
 DATABASE_URL = os.environ.get('DATABASE_URL')
-print(f"🔍 Database Environment Check:")
-print(f"   DATABASE_URL exists: {'YES' if DATABASE_URL else 'NO'}")
-print(f"   DATABASE_URL value: {DATABASE_URL[:50] + '...' if DATABASE_URL else 'None'}")
-print(f"   All environment variables containing 'DATABASE': {[k for k in os.environ.keys() if 'DATABASE' in k.upper()]}")
-print(f"   RENDER environment: {os.environ.get('RENDER', 'Not set')}")
-print(f"   Python version: {sys.version}")
-print(f"   Current working directory: {os.getcwd()}")
+log.debug("database environment", extra={
+    'database_url_set': DATABASE_URL is not None,
+    'database_env_vars': [k for k in os.environ.keys() if 'DATABASE' in k.upper()],
+    'render': os.environ.get('RENDER'),
+    'python': sys.version,
+    'cwd': os.getcwd()
+})
 
 # Initialize connector variables
 mysql_connector = None
@@ -25,63 +41,175 @@ psycopg2 = None
 psycopg2_extras = None
 urlparse = None
 
+# DATABASE_URL=sqlite:///file.db selects the embedded stand-in (no server needed)
+USE_SQLITE = DATABASE_URL is not None and DATABASE_URL.startswith('sqlite:')
+
 # Try to import based on environment
 try:
-    if DATABASE_URL:
+    if USE_SQLITE:
+        pass
+    elif DATABASE_URL:
         # Production (Render) - use PostgreSQL
-        print("   📦 Importing PostgreSQL dependencies...")
         import psycopg2
         import psycopg2.extras as psycopg2_extras
         from urllib.parse import urlparse
-        print("   ✅ PostgreSQL imports successful")
     else:
         # Development - use MySQL
-        print("   📦 Importing MySQL dependencies...")
         import mysql.connector as mysql_connector
-        print("   ✅ MySQL imports successful")
 except ImportError as e:
-    print(f"   ❌ Import error: {e}")
+    log.warning("database driver import failed, trying fallbacks", extra={'error': str(e)})
     # Fallback imports
     try:
-        print("   🔄 Trying fallback imports...")
         import psycopg2
         import psycopg2.extras as psycopg2_extras
         from urllib.parse import urlparse
-        print("   ✅ Fallback PostgreSQL imports successful")
     except ImportError:
         try:
             import mysql.connector as mysql_connector
-            print("   ✅ Fallback MySQL imports successful")
         except ImportError as e2:
-            print(f"   💥 All imports failed: {e2}")
+            log.critical("no database driver available", extra={'error': str(e2)})
             raise
 
+# Resume data is cached per worker and shared between workers through the
+# filesystem; any write to one of these tables invalidates it everywhere.
+RESUME_TABLES = ('institutions', 'positions', 'experiences', 'skills')
+resume_cache = VersionedCache('resume', ttl=float(os.environ.get('RESUME_CACHE_TTL', 300)))
+
+# With RESUME_SNAPSHOT on (the default) the resume tree is compiled once into a
+# frozen snapshot file that every worker loads, and getResumeData() returns the
+# in-memory object without touching the database. The snapshot follows
+# resume_cache's version token, checked at most every RESUME_SNAPSHOT_CHECK seconds,
+# and is rebuilt after RESUME_SNAPSHOT_MAX_AGE seconds regardless.
+RESUME_SNAPSHOT = os.environ.get('RESUME_SNAPSHOT', '1') != '0'
+resume_snapshot = Snapshot('resume', version=resume_cache.version,
+                           interval=float(os.environ.get('RESUME_SNAPSHOT_CHECK', 1)),
+                           max_age=float(os.environ.get('RESUME_SNAPSHOT_MAX_AGE', 3600)))
+
+# User rows by email, so a login costs at most one indexed lookup. Entries
+# expire after USER_CACHE_TTL seconds to pick up changes made by other workers.
+user_cache = LRUCache(maxsize=int(os.environ.get('USER_CACHE_SIZE', 1024)), ttl=float(os.environ.get('USER_CACHE_TTL', 60)))
+
+# Accounts (re)created every time the schema is rebuilt.
+SEED_USERS = [
+    {'email': 'owner@email.com', 'password': 'password', 'role': 'owner', 'name': 'Owner'},
+    {'email': 'guest@email.com', 'password': 'password', 'role': 'guest', 'name': 'Guest'},
+]
+
+# Secondary indexes for every lookup path: (table, index name, columns).
+# PostgreSQL does not index foreign keys by itself; users.email (UNIQUE) and
+# the feedback listing (primary key order) are already covered.
+INDEXES = [
+    ('positions', 'idx_positions_inst_id', ['inst_id']),
+    ('experiences', 'idx_experiences_position_id', ['position_id']),
+    ('skills', 'idx_skills_experience_id', ['experience_id']),
+    ('chat_messages', 'idx_chat_messages_room_sent_at', ['room', 'sent_at']),
+]
+
+# Bump when the migration logic itself changes in a way the schema files don't capture.
+SCHEMA_VERSION = 1
+MIGRATION_LOCK_ID = 477001
+
+# Parameterized statements of these kinds are prepared once per pooled
+# connection and re-executed from its cache (PostgreSQL PREPARE/EXECUTE,
+# mysql.connector prepared cursors; sqlite3 caches compiled statements itself).
+# DB_STATEMENT_CACHE_SIZE=0 turns this off, e.g. behind a transaction-pooling PgBouncer.
+STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 128))
+ROW_TYPES = ('dict', 'tuple', 'namedtuple')
+_statement_ids = itertools.count(1)
+
+_WRITE_STATEMENT = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE|TRUNCATE|DROP|ALTER|CREATE)\b', re.IGNORECASE)
+_SCHEMA_STATEMENT = re.compile(r'^\s*(TRUNCATE|DROP|ALTER|CREATE)\b', re.IGNORECASE)
+_PREPARABLE_STATEMENT = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+_INSERT_STATEMENT = re.compile(r'^\s*INSERT\b', re.IGNORECASE)
+_PLACEHOLDER = re.compile(r'%[s%]')
+_RESUME_TABLE_NAME = re.compile(r'\b(' + '|'.join(RESUME_TABLES) + r')\b', re.IGNORECASE)
+_USERS_TABLE_NAME = re.compile(r'\busers\b', re.IGNORECASE)
+_STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)\s+[`"]?(\w+)', re.IGNORECASE)
+
+class DatabaseUnavailable(Exception):
+    """
+    Raised by insertRows() when the database cannot be reached (as opposed to
+    rejecting a row). The first `done` rows were handled, inserted or reported
+    as errors, before the failure; the rest were not attempted.
+    """
+
+    def __init__(self, message, done=0):
+        super().__init__(message)
+        self.done = done
+
+def isConnectionError(err):
+    """
+    Returns True if `err` means the database could not be reached or used at
+    all, rather than that it rejected a particular statement or row.
+    """
+    if isinstance(err, PoolTimeout):
+        return True
+    if psycopg2 is not None and isinstance(err, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        return True
+    if mysql_connector is not None and isinstance(err, (mysql_connector.errors.OperationalError, mysql_connector.errors.InterfaceError)):
+        return True
+    return isinstance(err, sqlite_backend.OperationalError)
+
+@lru_cache(maxsize=512)
+def statementLabels(query):
+    """
+    Returns (operation, table) metric labels for a SQL statement, e.g. ('SELECT', 'feedback').
+    """
+    words = query.split(None, 1)
+    table = _STATEMENT_TABLE.search(query)
+    return (words[0].upper() if words else ''), (table.group(1).lower() if table else '')
+
+@lru_cache(maxsize=512)
+def numberedPlaceholders(query):
+    """
+    Rewrite %s placeholders as $1, $2, ... and %% as % for a PostgreSQL
+    PREPARE, the same substitutions psycopg2 makes when it sends parameters.
+    """
+    counter = itertools.count(1)
+    return _PLACEHOLDER.sub(lambda match: f"${next(counter)}" if match.group(0) == '%s' else '%', query)
+
+@lru_cache(maxsize=256)
+def _rowClass(columns):
+    return collections.namedtuple('Row', columns, rename=True)
+
+def shapeRows(description, rows, row_type='dict'):
+    """
+    Convert tuple rows fetched from a cursor into `row_type` (see ROW_TYPES).
+    """
+    if row_type == 'tuple':
+        return rows
+    columns = tuple(column[0] for column in description)
+    if row_type == 'namedtuple':
+        cls = _rowClass(columns)
+        return [cls._make(row) for row in rows]
+    return [dict(zip(columns, row)) for row in rows]
+
 class database:
 
-    def __init__(self, purge=False):
-        print("🚀 Initializing database connection...")
-        
-        # Check environment variables to determine if we're in production
-        render_env = os.environ.get('RENDER')
-        flask_env = os.environ.get('FLASK_ENV')
-        port_env = os.environ.get('PORT')  # Render sets this
-        
-        print(f"   🔍 DATABASE_URL: {'SET' if DATABASE_URL else 'NOT SET'}")
-        print(f"   🔍 RENDER: {render_env}")
-        print(f"   🔍 FLASK_ENV: {flask_env}")
-        print(f"   🔍 PORT: {port_env}")
-        print(f"   🔍 psycopg2 available: {psycopg2 is not None}")
-        print(f"   🔍 mysql_connector available: {mysql_connector is not None}")
-        
+    def __init__(self, purge=False, auto_migrate=None):
+        """
+        Args:
+            purge (bool): Rebuild and reseed the schema even if it is current.
+            auto_migrate (bool): Check the schema checksum and migrate if needed.
+                Defaults to the DB_AUTO_MIGRATE environment variable (on unless "0").
+        """
         # ALWAYS use PostgreSQL when on Render (DATABASE_URL is set)
-        self.is_production = DATABASE_URL is not None
-        
-        print(f"   Production mode: {self.is_production}")
-        
+        self.backend = 'sqlite' if USE_SQLITE else ('postgresql' if DATABASE_URL else 'mysql')
+        self.is_production = self.backend == 'postgresql'
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("database settings", extra={
+                'backend': self.backend,
+                'render': os.environ.get('RENDER'),
+                'flask_env': os.environ.get('FLASK_ENV'),
+                'port': os.environ.get('PORT'),  # Render sets this
+                'psycopg2': psycopg2 is not None,
+                'mysql_connector': mysql_connector is not None
+            })
+
         if self.is_production:
-            print("   🐘 Setting up PostgreSQL connection...")
             if psycopg2 is None:
-                print("   ❌ ERROR: psycopg2 is None but we need PostgreSQL!")
+                log.critical("psycopg2 is not installed but DATABASE_URL is set")
                 raise Exception("PostgreSQL connector not available")
                 
             if DATABASE_URL:
@@ -92,127 +220,356 @@ class database:
                 self.user = url.username
                 self.port = url.port or 5432
                 self.password = url.password
-                print(f"   Host: {self.host}, Database: {self.database}, User: {self.user}")
             else:
                 # This should never happen since we check DATABASE_URL above
-                print("   ⚠️ No DATABASE_URL found, but is_production=True. This is an error.")
                 raise Exception("DATABASE_URL is required in production mode")
+        elif self.backend == 'sqlite':
+            self.database = sqlite_backend.pathFromUrl(DATABASE_URL)
+            self.host = self.user = self.port = self.password = None
         else:
-            print("   🐬 Setting up MySQL connection...")
             # Local MySQL settings
             self.database = 'db'
             self.host = '127.0.0.1'
             self.user = 'master'
             self.port = 3306
             self.password = 'master'
-            print(f"   Host: {self.host}, Database: {self.database}, User: {self.user}")
+        log.debug("database target", extra={'backend': self.backend,
+                                             'host': self.host, 'database': self.database, 'user': self.user})
         
         # Encryption settings
         self.encryption = {
-            'oneway': {
-                'salt': b'averysaltysailortookalongwalkoffashortbridge',
+            # Passwords are hashed with a per-user salt stored alongside the
+            # hash; n/r/p can be tuned with SCRYPT_N/R/P (see
+            # `python -m flask_app.utils.crypto.passwords --target-ms 100`).
+            'oneway': passwords.configuredParams({
                 'n': 2**5,  # CPU/memory cost factor
                 'r': 9,     # Block size factor
                 'p': 1      # Parallelization factor
+            }),
+            # Global salt and parameters of hashes written before per-user salts.
+            'legacy': {
+                'salt': b'averysaltysailortookalongwalkoffashortbridge',
+                'n': 2**5,
+                'r': 9,
+                'p': 1
             },
             'reversible': {
-                'key': '7pK_fnSKIjZKuv_Gwc--sZEMKn2zc8VvD6zS96XcNHE='
+                'keys': crypto.configuredKeys()  # newest first, see FERNET_KEYS
             }
         }
+        self._dummy_hash = None
         
+        # Under the eventlet worker, queries yield to the hub instead of
+        # blocking it (psycopg2 wait callback / pure-Python MySQL protocol).
+        self.green = green.greenMode()
+        self.connect_timeout = float(os.environ.get('DB_CONNECT_TIMEOUT', 10))
+        if self.green and self.is_production:
+            green.enablePsycopg2()
+
+        # Connections are pooled per worker process and shared by every
+        # `database` instance pointing at the same server.
+        self.pool = getPool(
+            key=(self.backend, self.host, self.port, self.database, self.user),
+            connect=self._connect,
+            ping=self._ping
+        )
+        self.insert_batch_size = int(os.environ.get('DB_INSERT_BATCH_SIZE', 500))
+
         # Determine the absolute path to the data files
         base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-        data_path = os.path.join(base_dir, 'database/')
+        self.data_path = os.path.join(base_dir, 'database/')
 
-        print(f"   📂 Using data path: {data_path}")
-        print("   🏗️ Creating tables...")
-        self.createTables(purge=purge, data_path=data_path)
-        print("✅ Database initialization complete!")
+        if auto_migrate is None:
+            auto_migrate = os.environ.get('DB_AUTO_MIGRATE', '1') != '0'
+        if auto_migrate or purge:
+            self.migrate(force=purge)
 
-    def query(self, query="SELECT CURRENT_DATE", parameters=None):
-        results = []
-        try:
-            if self.is_production:
-                # PostgreSQL connection
-                try:
-                    # For Render deployment, use sslmode=require
-                    cnx = psycopg2.connect(
-                        host=self.host,
-                        user=self.user,
-                        password=self.password,
-                        port=self.port,
-                        database=self.database,
-                        sslmode='require'
-                    )
-                except psycopg2.OperationalError as e:
-                    print(f"   ⚠️ PostgreSQL connection failed with sslmode=require: {e}")
-                    print("   🔄 Trying again without SSL...")
-                    # Try again without SSL
-                    cnx = psycopg2.connect(
-                        host=self.host,
-                        user=self.user,
-                        password=self.password,
-                        port=self.port,
-                        database=self.database
-                    )
-                
-                cur = cnx.cursor(cursor_factory=psycopg2_extras.RealDictCursor)
-                
-                if parameters is not None:
-                    cur.execute(query, parameters)
-                else:
-                    cur.execute(query)
-                
-                # Fetch results
-                try:
-                    results = cur.fetchall()
-                    # Convert RealDictRow to regular dict
-                    results = [dict(r) for r in results]
-                except psycopg2.ProgrammingError:
-                    # No results to fetch (INSERT, UPDATE, DELETE, etc.)
-                    results = []
-                
-                cnx.commit()
-                cur.close()
-                cnx.close()
-            else:
-                # MySQL connection
-                cnx = mysql_connector.connect(
+    def _connect(self):
+        """
+        Open a new raw connection to the configured backend. Only the pool calls this.
+        """
+        with metrics.connect_seconds.time(backend=self.backend):
+            if self.green and self.is_production:
+                with green.deadline(self.connect_timeout, psycopg2.OperationalError("connection timed out")):
+                    return self._openConnection()
+            return self._openConnection()
+
+    def _openConnection(self):
+        if self.backend == 'sqlite':
+            return sqlite_backend.connect(DATABASE_URL, timeout=self.connect_timeout, cached_statements=STATEMENT_CACHE_SIZE)
+        if self.is_production:
+            try:
+                # For Render deployment, use sslmode=require
+                return psycopg2.connect(
                     host=self.host,
                     user=self.user,
                     password=self.password,
                     port=self.port,
                     database=self.database,
-                    charset='latin1'
+                    sslmode='require'
                 )
+            except psycopg2.OperationalError as e:
+                log.warning("postgresql connection with sslmode=require failed, retrying without SSL", extra={'error': str(e)})
+                # Try again without SSL
+                return psycopg2.connect(
+                    host=self.host,
+                    user=self.user,
+                    password=self.password,
+                    port=self.port,
+                    database=self.database
+                )
+        else:
+            return mysql_connector.connect(
+                host=self.host,
+                user=self.user,
+                password=self.password,
+                port=self.port,
+                database=self.database,
+                charset='latin1',
+                # The C extension blocks the whole eventlet hub while it waits
+                use_pure=self.green
+            )
 
-                if parameters is not None:
-                    cur = cnx.cursor(dictionary=True)
+    def _ping(self, cnx):
+        """
+        Raise if a pooled connection can no longer be used.
+        """
+        if self.is_production:
+            if cnx.closed:
+                raise psycopg2.InterfaceError("connection already closed")
+            cur = cnx.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            cnx.rollback()
+        elif self.backend == 'sqlite':
+            cnx.raw.execute("SELECT 1")
+        else:
+            cnx.ping(reconnect=False)
+
+    def poolStats(self):
+        """
+        Returns the connection pool counters for this worker process.
+
+        Returns:
+            dict: created/closed/checkouts/waits/timeouts/health_check_failures/
+                  recycled/errors counters plus size, idle, in_use and max_size.
+        """
+        return self.pool.stats()
+
+    def cacheStats(self):
+        """
+        Returns the hit/miss counters of the caches used by this class.
+        """
+        return {'resume': resume_cache.stats(), 'resume_snapshot': resume_snapshot.stats(), 'users': user_cache.stats()}
+
+    def _afterWrite(self, query):
+        """
+        Invalidate cached data that a successfully executed statement may have changed.
+        """
+        if not _WRITE_STATEMENT.match(query):
+            return
+        if _SCHEMA_STATEMENT.match(query):
+            self.pool.invalidateStatements()
+        if _RESUME_TABLE_NAME.search(query):
+            resume_cache.invalidate()
+        if _USERS_TABLE_NAME.search(query):
+            user_cache.clear()
+
+    def query(self, query="SELECT CURRENT_DATE", parameters=None, rows='dict', strict=False):
+        """
+        Execute one statement in its own transaction and return its rows.
+
+        Parameterized statements are served from the pooled connection's
+        statement cache (see STATEMENT_CACHE_SIZE), so repeated SQL is parsed
+        and planned once per connection.
+
+        Args:
+            query (str): SQL with %s placeholders.
+            parameters (tuple): Values for the placeholders.
+            rows (str): 'dict' (default), 'tuple' or 'namedtuple'. Tuples skip
+                building a dict per row, which matters for large hot reads.
+            strict (bool): Re-raise errors (after logging them) instead of
+                returning [], for callers that must not mistake a failure for no rows.
+
+        Returns:
+            list: The rows, if any. On MySQL an INSERT returns the generated key
+                  as [{'LAST_INSERT_ID()': id}], read from the cursor; use
+                  insertRow() for a backend-independent way. Empty on errors.
+        """
+        results = []
+        rowcount = 0
+        started = time.perf_counter()
+        try:
+            with self.pool.session() as conn:
+                cur, cached = self._execute(conn, query, parameters)
+
+                # Fetch results (INSERT, UPDATE, DELETE, etc. have none)
+                if cur.description is not None:
+                    results = shapeRows(cur.description, cur.fetchall(), rows)
+                    rowcount = len(results)
+                else:
+                    rowcount = max(cur.rowcount, 0)
+                    if self.backend == 'mysql' and _INSERT_STATEMENT.match(query):
+                        results = shapeRows((('LAST_INSERT_ID()',),), [(cur.lastrowid,)], rows)
+
+                conn.raw.commit()
+                if not cached:
+                    cur.close()
+
+            self._afterWrite(query)
+
+        except Exception as e:
+            # Parameters can hold passwords and personal data, so only their count is logged
+            log.error("database query failed", extra={
+                'error': str(e),
+                'query': ' '.join(query.split())[:500],
+                'parameters': len(parameters) if parameters is not None else 0
+            })
+            if strict:
+                raise
+        finally:
+            operation, table = statementLabels(query)
+            metrics.query_seconds.observe(time.perf_counter() - started, operation=operation, table=table)
+            metrics.query_rows.inc(rowcount, operation=operation, table=table)
+        return results
+
+    def _execute(self, conn, query, parameters):
+        """
+        Run `query` on a checked-out PooledConnection, through its statement
+        cache when the statement is parameterized and the cache has room.
+        Every backend returns plain tuple rows; query() shapes them.
+
+        Returns:
+            tuple: (cursor, cached). Cached cursors belong to the connection and stay open.
+        """
+        cnx = conn.raw
+        statements = conn.statements
+        cacheable = (STATEMENT_CACHE_SIZE > 0 and bool(parameters)
+                     and _PREPARABLE_STATEMENT.match(query) is not None)
+
+        if self.backend == 'sqlite':
+            # sqlite3 keeps its own per-connection cache of compiled statements
+            cur = cnx.cursor(dictionary=False)
+            if parameters is not None:
+                cur.execute(query, parameters)
+            else:
+                cur.execute(query)
+            return cur, False
+
+        if self.is_production:
+            cur = cnx.cursor()
+            name = statements.get(query)
+            if name is None and cacheable and len(statements) < STATEMENT_CACHE_SIZE:
+                name = f"stmt_{next(_statement_ids)}"
+                cur.execute(f"PREPARE {name} AS {numberedPlaceholders(query)}")
+                statements[query] = name
+            try:
+                if name is not None:
+                    cur.execute(f"EXECUTE {name} (" + ", ".join(["%s"] * len(parameters)) + ")", parameters)
+                elif parameters is not None:
                     cur.execute(query, parameters)
                 else:
-                    cur = cnx.cursor(dictionary=True)
                     cur.execute(query)
+            except Exception:
+                # Prepare again (under a new name) next time rather than trust the old one
+                statements.pop(query, None)
+                raise
+            return cur, False
 
-                # Fetch all results
-                results = cur.fetchall()
-                cnx.commit()
+        cur = statements.get(query)
+        if cur is None and cacheable and len(statements) < STATEMENT_CACHE_SIZE:
+            cur = cnx.cursor(prepared=True)
+            statements[query] = cur
+        if cur is not None:
+            try:
+                cur.execute(query, parameters)
+            except Exception:
+                statements.pop(query, None)
+                cur.close()
+                raise
+            return cur, True
+
+        cur = cnx.cursor()
+        if parameters is not None:
+            cur.execute(query, parameters)
+        else:
+            cur.execute(query)
+        return cur, False
+
+    def streamQuery(self, query, parameters=None, batch_size=1000, rows='tuple'):
+        """
+        Run a SELECT and yield its result in batches, holding at most
+        `batch_size` rows in memory: a named (server-side) cursor on
+        PostgreSQL, an unbuffered cursor on MySQL, a lazily stepped cursor on
+        SQLite. The pooled connection stays checked out until the generator
+        is exhausted or closed.
+
+        Args:
+            query (str): SQL with %s placeholders.
+            parameters (tuple): Values for the placeholders.
+            batch_size (int): Rows fetched per round trip.
+            rows (str): Row type, see query().
 
-                if "INSERT" in query.upper():
-                    cur.execute("SELECT LAST_INSERT_ID()")
-                    insert_result = cur.fetchall()
-                    cnx.commit()
-                    if insert_result:
-                        results = insert_result
-                        
+        Yields:
+            tuple: (columns, batch) for every batch; an empty result yields the
+                   columns once with an empty batch. Errors propagate.
+        """
+        started = time.perf_counter()
+        rowcount = 0
+        with self.pool.connection() as cnx:
+            if self.is_production:
+                cur = cnx.cursor(name=f"stream_{next(_statement_ids)}")
+                cur.itersize = batch_size
+            elif self.backend == 'sqlite':
+                cur = cnx.cursor(dictionary=False)
+            else:
+                cur = cnx.cursor()
+            try:
+                if parameters is not None:
+                    cur.execute(query, parameters)
+                else:
+                    cur.execute(query)
+                columns = None
+                while True:
+                    batch = cur.fetchmany(batch_size)
+                    if columns is None:
+                        # Named cursors only describe the result after the first fetch
+                        columns = [column[0] for column in cur.description]
+                    elif not batch:
+                        break
+                    rowcount += len(batch)
+                    yield columns, shapeRows(cur.description, batch, rows)
+                    if len(batch) < batch_size:
+                        break
+            finally:
                 cur.close()
-                cnx.close()
-            
-        except Exception as e:
-            print(f"💥 Database query error: {e}")
-            print(f"   Query: {query}")
-            print(f"   Parameters: {parameters}")
-            
-        return results
+            cnx.commit()
+
+        operation, table = statementLabels(query)
+        metrics.query_seconds.observe(time.perf_counter() - started, operation=operation, table=table)
+        metrics.query_rows.inc(rowcount, operation=operation, table=table)
+
+    def insertRow(self, table, columns, values, key):
+        """
+        Insert one row and return its generated `key` column in the same round
+        trip: INSERT ... RETURNING on PostgreSQL/SQLite, the cursor's lastrowid
+        on MySQL.
+
+        Args:
+            table (str): Table name.
+            columns (list): Column names.
+            values (list): One value per column.
+            key (str): The generated key column, e.g. 'comment_id'.
+
+        Returns:
+            The generated key, or None if the insert failed.
+        """
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        if self.backend == 'mysql':
+            rows = self.query(sql, values, rows='tuple')
+        else:
+            rows = self.query(f"{sql} RETURNING {key}", values, rows='tuple')
+        return rows[0][0] if rows else None
 
     def about(self, nested=False):    
         query = """select concat(col.table_schema, '.', col.table_name) as 'table',
@@ -245,61 +602,200 @@ class database:
             table_info[row['table']][row['column_name']]['table'] = row['table']
         return table_info
 
+    def schemaChecksum(self, data_path=None):
+        """
+        Returns a sha256 hex digest of everything that defines the seeded schema:
+        every create_tables/*.sql and initial_data/*.csv file, SEED_USERS and SCHEMA_VERSION.
+        """
+        data_path = data_path or self.data_path
+        digest = hashlib.sha256(f"version={SCHEMA_VERSION}\n".encode())
+        files = sorted(glob.glob(data_path + 'create_tables/*.sql')) + sorted(glob.glob(data_path + 'initial_data/*.csv'))
+        for path in files:
+            digest.update(os.path.relpath(path, data_path).encode() + b'\0')
+            with open(path, 'rb') as read_file:
+                digest.update(read_file.read())
+            digest.update(b'\0')
+        digest.update(json.dumps(SEED_USERS, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def indexChecksum(self):
+        """
+        Returns a sha256 hex digest of INDEXES. Index changes are applied in
+        place, without the destructive rebuild a schema change triggers.
+        """
+        return hashlib.sha256(json.dumps(INDEXES).encode()).hexdigest()
+
+    def migrate(self, force=False):
+        """
+        Rebuild and reseed the schema if the checksum stored in `schema_meta`
+        differs from schemaChecksum(). When nothing changed this is one
+        CREATE TABLE IF NOT EXISTS and one SELECT.
+
+        Concurrent callers (e.g. several gunicorn workers booting at once) are
+        serialized with a database-level lock, and the checksum is re-read once
+        the lock is held so only one of them does the work.
+
+        The checksums are read strictly: if they can't be read (database
+        down, timeout) this raises instead of mistaking the error for a
+        changed schema and wiping the tables.
+
+        Args:
+            force (bool): Rebuild even if the checksum matches.
+
+        Returns:
+            bool: True if the schema was rebuilt.
+        """
+        checksum = self.schemaChecksum()
+        index_checksum = self.indexChecksum()
+        if not force and not self.needsMigration(checksum, index_checksum):
+            log.debug("schema is current, skipping rebuild")
+            return False
+
+        with self._migrationLock():
+            rebuilt = force or self._storedChecksum() != checksum
+            if rebuilt:
+                log.info("schema changed, rebuilding tables", extra={'checksum': checksum, 'forced': force})
+                self.createTables(purge=True, data_path=self.data_path)
+                for user in SEED_USERS:
+                    self.createUser(**user)
+                self._storeChecksum('schema', checksum)
+            elif self._storedChecksum('indexes') != index_checksum:
+                log.info("indexes changed, updating them in place", extra={'checksum': index_checksum})
+                self.createIndexes()
+
+            if self._storedChecksum('indexes') != index_checksum:
+                self._storeChecksum('indexes', index_checksum)
+        return rebuilt
+
+    def schemaIsCurrent(self, checksum=None):
+        """
+        Returns True if the checksum recorded by the last migration matches
+        `checksum` (default: schemaChecksum()).
+        """
+        self.query("""CREATE TABLE IF NOT EXISTS schema_meta (
+                          name VARCHAR(100) PRIMARY KEY,
+                          checksum VARCHAR(64) NOT NULL,
+                          applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                      )""", strict=True)
+        return self._storedChecksum() == (checksum or self.schemaChecksum())
+
+    def needsMigration(self, checksum=None, index_checksum=None):
+        """
+        Returns True if migrate() would change anything: the schema or the
+        indexes differ from what the last migration recorded.
+        """
+        if not self.schemaIsCurrent(checksum):
+            return True
+        return self._storedChecksum('indexes') != (index_checksum or self.indexChecksum())
+
+    def _storedChecksum(self, name='schema'):
+        rows = self.query("SELECT checksum FROM schema_meta WHERE name = %s", (name,), rows='tuple', strict=True)
+        return rows[0][0] if rows else None
+
+    def _storeChecksum(self, name, checksum):
+        self.query("DELETE FROM schema_meta WHERE name = %s", (name,), strict=True)
+        self.query("INSERT INTO schema_meta (name, checksum) VALUES (%s, %s)", (name, checksum), strict=True)
+
+    def createIndexes(self):
+        """
+        Create every index in INDEXES that does not exist yet.
+        """
+        for table, name, columns in INDEXES:
+            if self.backend != 'mysql':
+                self.query(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+            else:
+                # MySQL has no CREATE INDEX IF NOT EXISTS
+                exists = self.query(
+                    "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+                    (table, name)
+                )
+                if not exists:
+                    self.query(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+            log.debug("index ensured", extra={'table': table, 'index': name})
+
+    @contextmanager
+    def _migrationLock(self):
+        """
+        Hold a server-side lock (pg_advisory_lock / GET_LOCK) on a pooled
+        connection for the duration of a migration. The connection is pinned,
+        so the migration's own queries run on it rather than needing more
+        connections from the pool.
+        """
+        if self.backend == 'sqlite':
+            with sqlite_backend.fileLock(DATABASE_URL):
+                yield
+            return
+
+        with self.pool.pin() as conn:
+            cnx = conn.raw
+            cur = cnx.cursor()
+            if self.is_production:
+                cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            else:
+                cur.execute("SELECT GET_LOCK(%s, 300)", ('schema_migrate',))
+            cur.fetchall()
+            try:
+                yield
+            finally:
+                if self.is_production:
+                    cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+                else:
+                    cur.execute("SELECT RELEASE_LOCK(%s)", ('schema_migrate',))
+                cur.fetchall()
+                cnx.commit()
+                cur.close()
+
     def createTables(self, purge=False, data_path='flask_app/database/'):
         """
         (1) Optionally drops existing tables (if purge==True).
         (2) Creates tables by running all .sql files in data_path/create_tables.
         (3) Inserts initial data from all .csv files in data_path/initial_data.
         """
-        print('🏗️ ----- createTables() -----')
-        
+        log.info("creating tables", extra={'purge': purge, 'data_path': data_path})
+
         if purge:
-            print('🧹 Purging (dropping) existing tables...')
-            
             if self.is_production:
-                print('   🐘 Using PostgreSQL CASCADE drops...')
                 # PostgreSQL: Drop tables in reverse dependency order
-                for table in ['skills', 'experiences', 'positions', 'institutions', 'feedback', 'users']:
+                for table in ['chat_messages', 'skills', 'experiences', 'positions', 'institutions', 'feedback', 'users']:
                     try:
                         self.query(f"DROP TABLE IF EXISTS {table} CASCADE")
-                        print(f"   ✅ Dropped table {table}")
+                        log.debug("dropped table", extra={'table': table})
                     except Exception as e:
-                        print(f"   ❌ Error dropping {table}: {str(e)}")
+                        log.error("dropping table failed", extra={'table': table, 'error': str(e)})
+            elif self.backend == 'sqlite':
+                # SQLite: children first, so foreign keys never dangle
+                for table in ['chat_messages', 'skills', 'experiences', 'positions', 'institutions', 'feedback', 'users']:
+                    self.query(f"DROP TABLE IF EXISTS {table}")
             else:
-                print('   🐬 Using MySQL foreign key checks...')
                 # MySQL: Temporarily turn off foreign key checks
                 try:
                     self.query("SET FOREIGN_KEY_CHECKS=0")
-                    for table in ['skills', 'experiences', 'positions', 'institutions', 'feedback', 'users']:
+                    for table in ['chat_messages', 'skills', 'experiences', 'positions', 'institutions', 'feedback', 'users']:
                         try:
                             self.query(f"DROP TABLE IF EXISTS {table}")
-                            print(f"   ✅ Dropped table {table}")
+                            log.debug("dropped table", extra={'table': table})
                         except Exception as e:
-                            print(f"   ❌ Error dropping {table}: {str(e)}")
+                            log.error("dropping table failed", extra={'table': table, 'error': str(e)})
                     self.query("SET FOREIGN_KEY_CHECKS=1")
                 except Exception as e:
-                    print(f"   ❌ Error with foreign key checks: {str(e)}")
-            print('✅ Done purging!')
+                    log.error("toggling foreign key checks failed", extra={'error': str(e)})
 
         # Create tables in the correct order
-        table_order = ['users', 'institutions', 'positions', 'experiences', 'skills', 'feedback']
-        print('📋 Creating tables...')
+        table_order = ['users', 'institutions', 'positions', 'experiences', 'skills', 'feedback', 'chat_messages']
         for table in table_order:
             try:
-                print(f"   📄 Running {data_path}create_tables/{table}.sql")
                 with open(data_path + f"create_tables/{table}.sql") as read_file:
                     create_statement = read_file.read()
                 
                 self.query(create_statement)
-                print(f"   ✅ Created table {table}")
+                log.debug("created table", extra={'table': table})
             except Exception as e:
-                print(f"   ❌ Error executing SQL for {table}: {str(e)}")
+                log.error("creating table failed", extra={'table': table, 'error': str(e)})
 
         # Insert initial data
-        print('📊 Inserting initial data...')
+        inserted = {}
         for table in table_order:
             try:
-                print(f"   📥 Inserting data into '{table}' from '{data_path}initial_data/{table}.csv'")
                 params = []
                 with open(data_path + f"initial_data/{table}.csv") as read_file:
                     scsv = read_file.read()            
@@ -308,16 +804,14 @@ class database:
             
                 # Insert the data
                 cols = params[0]; params = params[1:] 
-                self.insertRows(table=table, columns=cols, parameters=params)
-                print(f"   ✅ Inserted {len(params)} rows into {table}")
+                result = self.insertRows(table=table, columns=cols, parameters=params)
+                inserted[table] = result['inserted']
             except Exception as e:
-                print(f"   ⚠️ Error inserting into {table}: {str(e)}")
-                if 'params' in locals() and len(params) > 0:
-                    print(f"      Problematic row: {params[0]}")
-                else:
-                    print('      No initial data file found')
+                log.error("loading initial data failed", extra={'table': table, 'error': str(e)})
 
-        print("✅ ----- Done creating and populating tables -----")
+        # Indexes last, so the initial load doesn't maintain them row by row
+        self.createIndexes()
+        log.info("tables created and populated", extra={'inserted': inserted})
 
     def get_drop_order(self, dependencies):
         """
@@ -351,24 +845,37 @@ class database:
                 
         return result
 
-    def insertRows(self, table='table', columns=['x', 'y'], parameters=[['v11', 'v12'], ['v21', 'v22']]):
+    def insertRows(self, table='table', columns=['x', 'y'], parameters=[['v11', 'v12'], ['v21', 'v22']], batch_size=None):
         """
         Inserts each row in `parameters` into `table`, 
         matching each row to the list of `columns`.
+
+        Rows are sent in batches of `batch_size` (default: DB_INSERT_BATCH_SIZE),
+        one multi-row INSERT and one transaction per batch. If a batch fails it
+        is rolled back and retried row by row, so a bad row only costs itself
+        and is reported individually.
+
+        Returns:
+            dict: {'inserted': number of rows inserted,
+                   'errors': [{'row': [...], 'error': 'message'}, ...]}
+
+        Raises:
+            DatabaseUnavailable: The database could not be reached (see
+                isConnectionError); nothing is reported as a row error then.
         """
-        # Build the "INSERT INTO tablename (col1, col2, ...) VALUES (%s, %s, ...)"
-        placeholders = ", ".join(["%s"] * len(columns))
-        
-        if self.is_production:
-            # PostgreSQL: Use double quotes for identifiers
+        batch_size = batch_size or self.insert_batch_size
+
+        # Build the "INSERT INTO tablename (col1, col2, ...) VALUES ..." prefix
+        if self.backend != 'mysql':
+            # PostgreSQL and SQLite: Use double quotes for identifiers
             col_names = ", ".join([f'"{c}"' for c in columns])
-            sql = f'INSERT INTO "{table}" ({col_names}) VALUES ({placeholders})'
+            sql = f'INSERT INTO "{table}" ({col_names}) VALUES '
         else:
             # MySQL: Use backticks for identifiers
             col_names = ", ".join([f"`{c}`" for c in columns])
-            sql = f"INSERT INTO `{table}` ({col_names}) VALUES ({placeholders})"
+            sql = f"INSERT INTO `{table}` ({col_names}) VALUES "
 
-        # Insert each row
+        rows = []
         for row in parameters:
             cleaned = []
             for val in row:
@@ -376,55 +883,164 @@ class database:
                     cleaned.append(None)
                 else:
                     cleaned.append(val)
-            try:
-                self.query(sql, cleaned)
-            except Exception as err:
-                print(f"❌ Error inserting into {table}: {err}")
-                print(f"   Problematic row: {cleaned}")
+            rows.append(cleaned)
+
+        inserted = 0
+        errors = []
+        try:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                try:
+                    self._insertBatch(sql, len(columns), batch)
+                    inserted += len(batch)
+                    continue
+                except Exception as err:
+                    if isConnectionError(err):
+                        raise DatabaseUnavailable(str(err), done=start) from err
+                    if len(batch) > 1:
+                        # Retry one row at a time to find the offending rows.
+                        batch_error = None
+                    else:
+                        batch_error = err
+                for offset, row in enumerate(batch):
+                    try:
+                        if batch_error is not None:
+                            raise batch_error
+                        self._insertBatch(sql, len(columns), [row])
+                        inserted += 1
+                    except Exception as err:
+                        if isConnectionError(err):
+                            raise DatabaseUnavailable(str(err), done=start + offset) from err
+                        log.error("row insert failed", extra={'table': table, 'error': str(err)})
+                        errors.append({'row': row, 'error': str(err)})
+        finally:
+            if inserted:
+                self._afterWrite(sql)
+        return {'inserted': inserted, 'errors': errors}
+
+    def _insertBatch(self, sql, width, rows):
+        """
+        Insert `rows` with a single multi-row statement in its own transaction.
+        `sql` is an "INSERT INTO ... VALUES " prefix; errors propagate to the caller.
+        """
+        operation, table = statementLabels(sql)
+        with metrics.query_seconds.time(operation=operation, table=table), self.pool.connection() as cnx:
+            cur = cnx.cursor()
+            if self.is_production:
+                psycopg2_extras.execute_values(cur, sql + "%s", rows, page_size=len(rows))
+            else:
+                # mysql.connector rewrites executemany() on an INSERT into one multi-row VALUES list
+                placeholders = "(" + ", ".join(["%s"] * width) + ")"
+                cur.executemany(sql + placeholders, rows)
+            cnx.commit()
+            cur.close()
+        metrics.query_rows.inc(len(rows), operation=operation, table=table)
 
     def getResumeData(self):
         """
-        Returns a nested dictionary that represents the complete data
+        Returns a nested dictionary that represents the complete data:
+        institutions -> positions -> experiences -> skills, each level keyed by its id.
+
+        With RESUME_SNAPSHOT on, the result is a frozen snapshot (read-only
+        mappings and tuples) compiled once and shared by every worker; it is
+        replaced as soon as a write to RESUME_TABLES bumps the version token.
+        Otherwise it is served from `resume_cache` (see RESUME_CACHE_TTL).
+        Either way it is shared between callers, so treat it as read-only.
         """
-        # Get all institutions
-        institutions_query = "SELECT * FROM institutions"
-        institutions = self.query(institutions_query)
-        
+        if RESUME_SNAPSHOT:
+            return resume_snapshot.get(self._loadResumeData)
+        return resume_cache.get('tree', self._loadResumeData)
+
+    def _loadResumeData(self):
+        """
+        Load the resume tree with one query per table (four round trips in total,
+        regardless of how many rows there are) and assemble it in a single pass.
+        Raises if a query fails, so a database error is never cached as an empty resume.
+        """
+        institutions = self.query("SELECT * FROM institutions ORDER BY inst_id", strict=True)
+        positions = self.query("SELECT * FROM positions ORDER BY position_id", strict=True)
+        experiences = self.query("SELECT * FROM experiences ORDER BY experience_id", strict=True)
+        skills = self.query("SELECT * FROM skills ORDER BY skill_id", strict=True)
+
         result = {}
-        
         for inst in institutions:
-            inst_id = inst['inst_id']
-            result[inst_id] = inst
-            result[inst_id]['positions'] = {}
-            
-            # Get positions for this institution
-            positions_query = "SELECT * FROM positions WHERE inst_id = %s"
-            positions = self.query(positions_query, (inst_id,))
-            
-            for pos in positions:
-                pos_id = pos['position_id']
-                result[inst_id]['positions'][pos_id] = pos
-                result[inst_id]['positions'][pos_id]['experiences'] = {}
-                
-                # Get experiences for this position
-                experiences_query = "SELECT * FROM experiences WHERE position_id = %s"
-                experiences = self.query(experiences_query, (pos_id,))
-                
-                for exp in experiences:
-                    exp_id = exp['experience_id']
-                    result[inst_id]['positions'][pos_id]['experiences'][exp_id] = exp
-                    result[inst_id]['positions'][pos_id]['experiences'][exp_id]['skills'] = {}
-                    
-                    # Get skills for this experience
-                    skills_query = "SELECT * FROM skills WHERE experience_id = %s"
-                    skills = self.query(skills_query, (exp_id,))
-                    
-                    for skill in skills:
-                        skill_id = skill['skill_id']
-                        result[inst_id]['positions'][pos_id]['experiences'][exp_id]['skills'][skill_id] = skill
-            
+            inst['positions'] = {}
+            result[inst['inst_id']] = inst
+
+        # Index each level by id while attaching it to its parent, so children
+        # can be placed with a dict lookup. Rows whose parent is missing are
+        # dropped, matching the old per-parent queries.
+        position_index = {}
+        for pos in positions:
+            inst = result.get(pos['inst_id'])
+            if inst is None:
+                continue
+            pos['experiences'] = {}
+            inst['positions'][pos['position_id']] = pos
+            position_index[pos['position_id']] = pos
+
+        experience_index = {}
+        for exp in experiences:
+            pos = position_index.get(exp['position_id'])
+            if pos is None:
+                continue
+            exp['skills'] = {}
+            pos['experiences'][exp['experience_id']] = exp
+            experience_index[exp['experience_id']] = exp
+
+        for skill in skills:
+            exp = experience_index.get(skill['experience_id'])
+            if exp is not None:
+                exp['skills'][skill['skill_id']] = skill
+
         return result
 
+    def getFeedbackPage(self, before=None, limit=20):
+        """
+        Returns one page of feedback, newest first, using keyset pagination on
+        `comment_id` so every page is a single index range scan regardless of depth.
+
+        Args:
+            before (int): Only return comments with comment_id < before (None for the first page).
+            limit (int): Page size.
+
+        Returns:
+            dict: {'feedback': [rows...], 'next': cursor for the following page, or None}
+        """
+        if before is None:
+            rows = self.query("SELECT * FROM feedback ORDER BY comment_id DESC LIMIT %s", (limit + 1,))
+        else:
+            rows = self.query(
+                "SELECT * FROM feedback WHERE comment_id < %s ORDER BY comment_id DESC LIMIT %s",
+                (before, limit + 1)
+            )
+
+        # One extra row tells us whether another page exists without a COUNT(*)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {'feedback': rows, 'next': rows[-1]['comment_id'] if has_more else None}
+
+    def getChatHistory(self, room, before=None, limit=50, rows='dict'):
+        """
+        Returns up to `limit` chat messages for `room`, newest first, using
+        keyset pagination on `sent_at`.
+
+        Args:
+            room (str): Chat room name.
+            before (int): Only return messages with sent_at < before (None for the latest).
+            limit (int): Page size.
+            rows (str): Row type, see query().
+        """
+        if before is None:
+            return self.query(
+                "SELECT * FROM chat_messages WHERE room = %s ORDER BY sent_at DESC LIMIT %s",
+                (room, limit), rows=rows
+            )
+        return self.query(
+            "SELECT * FROM chat_messages WHERE room = %s AND sent_at < %s ORDER BY sent_at DESC LIMIT %s",
+            (room, before, limit), rows=rows
+        )
+
     def createUser(self, email='me@email.com', password='password', role='user', name='User'):
         """
         Create a new user in the database.
@@ -441,13 +1057,13 @@ class database:
         """
         try:
             # First check if user already exists
-            existing_user = self.query("SELECT * FROM users WHERE email = %s", (email,))
+            existing_user = self.getUser(email)
             if existing_user:
                 return {'success': 0, 'message': 'User already exists'}
             
-            # Encrypt the password
+            # Hash the password off the event loop
             encrypted_password = self.onewayEncrypt(password)
-            
+
             # Create new user
             self.query(
                 "INSERT INTO users (email, password, role, name) VALUES (%s, %s, %s, %s)",
@@ -455,9 +1071,23 @@ class database:
             )
             return {'success': 1}
         except Exception as e:
-            print(f"Error creating user: {str(e)}")
+            log.error("creating user failed", extra={'error': str(e)})
             return {'success': 0, 'message': str(e)}
         
+    def getUser(self, email):
+        """
+        Returns the `users` row for `email` (or None), served from `user_cache`
+        when possible. Only existing users are cached.
+        """
+        user = user_cache.get(email)
+        if user is None:
+            rows = self.query("SELECT * FROM users WHERE email = %s", (email,))
+            if not rows:
+                return None
+            user = rows[0]
+            user_cache.set(email, user)
+        return user
+
     def authenticate(self, email='me@email.com', password='password'):
         """
         Authenticate a user by checking if the email and password combination exists.
@@ -472,48 +1102,74 @@ class database:
                 {'success': 0, 'message': 'error message'} if failed
         """
         try:
-            # Encrypt the provided password
-            encrypted_password = self.onewayEncrypt(password)
-            
-            # Check if the email and encrypted password combination exists
-            user = self.query(
-                "SELECT * FROM users WHERE email = %s AND password = %s", 
-                (email, encrypted_password)
-            )
-            
-            if user:
-                return {'success': 1, 'role': user[0]['role'], 'name': user[0]['name']}
-            else:
+            user = self.getUser(email)
+            if user is None:
+                # Do the same hashing work as for a wrong password, so the
+                # response time doesn't reveal which emails have accounts
+                self.verifyPassword(password, self._dummyHash())
+                return {'success': 0, 'message': 'Invalid email or password'}
+            if not self.verifyPassword(password, user['password']):
                 return {'success': 0, 'message': 'Invalid email or password'}
+
+            # Upgrade legacy or outdated hashes now that we know the plaintext
+            oneway = self.encryption['oneway']
+            if passwords.needsRehash(user['password'], oneway['n'], oneway['r'], oneway['p']):
+                self.query(
+                    "UPDATE users SET password = %s WHERE email = %s",
+                    (self.onewayEncrypt(password), email)
+                )
+
+            return {'success': 1, 'role': user['role'], 'name': user['name']}
         except Exception as e:
-            print(f"Error authenticating user: {str(e)}")
+            log.error("authentication failed with an error", extra={'error': str(e)})
             return {'success': 0, 'message': str(e)}
 
+    def _dummyHash(self):
+        # A hash with the current scrypt parameters that no password matches
+        if self._dummy_hash is None:
+            self._dummy_hash = self.onewayEncrypt(secrets.token_urlsafe(32))
+        return self._dummy_hash
+
     def onewayEncrypt(self, string):
         """
-        Encrypt a string using scrypt (one-way encryption).
+        Hash a string using scrypt (one-way encryption) with a fresh random salt.
+        The work runs in a native thread under eventlet (see passwords.offload).
         
         Args:
             string (str): The string to encrypt
             
         Returns:
-            str: The encrypted string in hexadecimal format
+            str: 'scrypt$n$r$p$salt$hash', see utils/crypto/passwords.py
         """
-        encrypted_string = hashlib.scrypt(
-            string.encode('utf-8'),
-            salt=self.encryption['oneway']['salt'],
-            n=self.encryption['oneway']['n'],
-            r=self.encryption['oneway']['r'],
-            p=self.encryption['oneway']['p']
-        ).hex()
-        return encrypted_string
+        oneway = self.encryption['oneway']
+        with metrics.password_seconds.time(operation='hash'):
+            return passwords.offload(passwords.hashPassword, string, oneway['n'], oneway['r'], oneway['p'])
+
+    def verifyPassword(self, string, stored):
+        """
+        Check a string against a value returned by onewayEncrypt() (or a
+        pre-salt legacy hash) without blocking the event loop.
+
+        Returns:
+            bool: True if they match.
+        """
+        with metrics.password_seconds.time(operation='verify'):
+            return passwords.offload(passwords.verifyPassword, string, stored, self.encryption['legacy'])
 
     def reversibleEncrypt(self, type, message):
-        fernet = Fernet(self.encryption['reversible']['key'])
-        
+        """
+        Encrypt or decrypt `message` with the configured Fernet keys. The cipher
+        is built once per key set (see utils/crypto/crypto.py).
+
+        Args:
+            type (str): 'encrypt' or 'decrypt'
+            message (str | bytes): Plaintext to encrypt, or a token to decrypt.
+        """
+        keys = self.encryption['reversible']['keys']
+
         if type == 'encrypt':
-            message = fernet.encrypt(message.encode())
+            message = crypto.encrypt(message, keys)
         elif type == 'decrypt':
-            message = fernet.decrypt(message).decode()
+            message = crypto.decrypt(message, keys)
 
         return message
@@ -0,0 +1,164 @@
+import re
+import sys
+import json
+import random
+import argparse
+from .database import database, user_cache, INDEXES
+
+# Rows added by seed(); every seeded row is tagged so cleanup() can find it.
+SEED_TAG = 'explain-seed'
+
+
+class RecordingDatabase(database):
+    """
+    A `database` that remembers every statement it runs, so the check
+    explains exactly the SQL the application issues.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.recorded = []
+        super().__init__(*args, **kwargs)
+
+    def query(self, query="SELECT CURRENT_DATE", parameters=None, rows='dict', strict=False):
+        self.recorded.append((query, parameters))
+        return super().query(query, parameters, rows=rows, strict=strict)
+
+
+def seed(db, institutions=200, feedback=100000, chat=100000, users=10000):
+    """
+    Add a large synthetic dataset so the planner's choices match production
+    scale instead of the handful of rows in initial_data. Rows are tagged with
+    SEED_TAG; remove them with cleanup(). Seeded institutions show up on the
+    resume page until then, so seed a development or staging database.
+    """
+    rng = random.Random(477)
+    db.insertRows('institutions', ['type', 'name', 'department'],
+                  [['Academia', f"{SEED_TAG} {i}", 'Seeded'] for i in range(institutions)])
+    inst_ids = [r['inst_id'] for r in db.query("SELECT inst_id FROM institutions WHERE name LIKE %s", (SEED_TAG + '%',))]
+
+    db.insertRows('positions', ['inst_id', 'title', 'responsibilities', 'start_date'],
+                  [[inst_id, SEED_TAG, 'Seeded', '2020-01-01'] for inst_id in inst_ids for _ in range(5)])
+    position_ids = [r['position_id'] for r in db.query("SELECT position_id FROM positions WHERE title = %s", (SEED_TAG,))]
+
+    db.insertRows('experiences', ['position_id', 'name', 'description'],
+                  [[position_id, SEED_TAG, 'Seeded'] for position_id in position_ids for _ in range(5)])
+    experience_ids = [r['experience_id'] for r in db.query("SELECT experience_id FROM experiences WHERE name = %s", (SEED_TAG,))]
+
+    db.insertRows('skills', ['experience_id', 'name', 'skill_level'],
+                  [[experience_id, SEED_TAG, rng.randint(1, 10)] for experience_id in experience_ids for _ in range(4)])
+    db.insertRows('feedback', ['name', 'email', 'comment'],
+                  [[SEED_TAG, f"{i}@seed.invalid", 'Seeded comment'] for i in range(feedback)])
+    db.insertRows('chat_messages', ['room', 'sent_at', 'msg', 'msg_class'],
+                  [[f"{SEED_TAG}-{i % 50}", 1_600_000_000_000_000 + i, 'Seeded message', 'user-message'] for i in range(chat)])
+    db.insertRows('users', ['email', 'password', 'role', 'name'],
+                  [[f"{i}@seed.invalid", 'x', 'guest', SEED_TAG] for i in range(users)])
+    analyze(db)
+
+
+def cleanup(db):
+    """
+    Delete every row added by seed().
+    """
+    db.query("DELETE FROM skills WHERE name = %s", (SEED_TAG,))
+    db.query("DELETE FROM experiences WHERE name = %s", (SEED_TAG,))
+    db.query("DELETE FROM positions WHERE title = %s", (SEED_TAG,))
+    db.query("DELETE FROM institutions WHERE name LIKE %s", (SEED_TAG + '%',))
+    db.query("DELETE FROM feedback WHERE name = %s", (SEED_TAG,))
+    db.query("DELETE FROM chat_messages WHERE room LIKE %s", (SEED_TAG + '%',))
+    db.query("DELETE FROM users WHERE name = %s", (SEED_TAG,))
+    analyze(db)
+
+
+def analyze(db):
+    """
+    Refresh planner statistics for the tables the check covers.
+    """
+    tables = ['institutions', 'positions', 'experiences', 'skills', 'feedback', 'chat_messages', 'users']
+    if db.is_production:
+        db.query("ANALYZE " + ", ".join(tables))
+    elif db.backend == 'sqlite':
+        db.query("ANALYZE")
+    else:
+        db.query("ANALYZE TABLE " + ", ".join(tables))
+
+
+def applicationQueries(db):
+    """
+    Run the lookup paths of getResumeData, authenticate (getUser), the
+    feedback listing and chat history, and return the statements they issued.
+    """
+    db.recorded = []
+    db._loadResumeData()  # bypass the resume cache
+    user_cache.clear()
+    db.getUser('owner@email.com')
+    first = db.getFeedbackPage(limit=20)
+    db.getFeedbackPage(before=first['next'] or 1, limit=20)
+    db.getChatHistory('main', limit=50)
+    db.getChatHistory('main', before=2**62, limit=50)
+    return list(db.recorded)
+
+
+def sequentialScans(db, query, parameters):
+    """
+    Returns the tables `query` reads with a full sequential scan, according
+    to EXPLAIN (EXPLAIN QUERY PLAN on SQLite).
+    """
+    if db.is_production:
+        rows = db.query("EXPLAIN (FORMAT JSON) " + query, parameters)
+        plan = rows[0]['QUERY PLAN'] if rows else []
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        scans, stack = [], [node['Plan'] for node in plan]
+        while stack:
+            node = stack.pop()
+            if node.get('Node Type') == 'Seq Scan':
+                scans.append(node.get('Relation Name'))
+            stack.extend(node.get('Plans', []))
+        return scans
+    if db.backend == 'sqlite':
+        details = [row['detail'] for row in db.query("EXPLAIN QUERY PLAN " + query, parameters)]
+        # A scan in ORDER BY order (no temp b-tree) under a LIMIT stops early
+        bounded = re.search(r'\bLIMIT\b', query, re.IGNORECASE) and not any('TEMP B-TREE' in d for d in details)
+        return [d.split()[1] for d in details if re.match(r'^SCAN \w+$', d) and not bounded]
+    rows = db.query("EXPLAIN " + query, parameters)
+    return [row['table'] for row in rows if row.get('type') == 'ALL']
+
+
+def check(db):
+    """
+    EXPLAIN every application query and flag sequential scans on selective
+    ones (those with WHERE or LIMIT). Statements that read a whole table,
+    like the resume loads, are expected to scan it and are only reported.
+
+    Returns:
+        list: [{'query', 'seq_scans', 'flagged'}, ...]
+    """
+    report = []
+    for query, parameters in applicationQueries(db):
+        scans = sequentialScans(db, query, parameters)
+        selective = re.search(r'\b(WHERE|LIMIT)\b', query, re.IGNORECASE) is not None
+        report.append({'query': ' '.join(query.split()), 'seq_scans': scans, 'flagged': bool(scans) and selective})
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Flag sequential scans in the application queries with EXPLAIN.')
+    parser.add_argument('--seed', action='store_true', help='add a large tagged synthetic dataset first')
+    parser.add_argument('--cleanup', action='store_true', help='remove the seeded rows afterwards')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for the seeded row counts')
+    args = parser.parse_args()
+
+    db = RecordingDatabase(auto_migrate=True)
+    db.createIndexes()
+    if args.seed:
+        seed(db, institutions=int(200 * args.scale), feedback=int(100000 * args.scale),
+             chat=int(100000 * args.scale), users=int(10000 * args.scale))
+
+    report = check(db)
+    for entry in report:
+        status = 'FLAG' if entry['flagged'] else ('scan' if entry['seq_scans'] else 'ok  ')
+        print(f"{status} {entry['query']}" + (f"  [seq scan: {', '.join(entry['seq_scans'])}]" if entry['seq_scans'] else ''))
+    print(f"Indexes managed: {', '.join(name for _, name, _ in INDEXES)}")
+
+    if args.cleanup:
+        cleanup(db)
+    sys.exit(1 if any(entry['flagged'] for entry in report) else 0)
@@ -0,0 +1,251 @@
+import os
+import sys
+import time
+import argparse
+import functools
+from contextlib import contextmanager
+
+# Makes the database drivers cooperate with eventlet. A blocking call inside
+# a C extension (libpq, the mysql.connector C extension) cannot be switched
+# away from by monkey-patching, so one slow query would stall every greenlet
+# in the worker, chat sockets included.
+#
+# - psycopg2: a wait callback runs each libpq operation in non-blocking mode
+#   and yields to the hub (trampoline) until the socket is ready.
+# - mysql.connector: the pure-Python protocol implementation talks through
+#   the standard `socket` module, which eventlet has already made green.
+
+
+def eventletPatched():
+    """
+    Returns True if eventlet has monkey-patched sockets and threads in this process.
+    """
+    eventlet = sys.modules.get('eventlet')
+    if eventlet is None:
+        return False
+    from eventlet import patcher
+    return patcher.is_monkey_patched('socket') and patcher.is_monkey_patched('thread')
+
+
+def greenMode():
+    """
+    Returns True if database calls should yield to the eventlet hub.
+
+    Controlled by DB_GREEN: 'auto' (default) follows eventletPatched(), '1'
+    forces it on, '0' keeps the blocking drivers.
+    """
+    setting = os.environ.get('DB_GREEN', 'auto')
+    if setting == 'auto':
+        return eventletPatched()
+    return setting == '1'
+
+
+def eventletWaitCallback(conn, timeout=-1):
+    """
+    psycopg2 wait callback that parks the current greenlet until libpq can make progress.
+    """
+    import psycopg2
+    from psycopg2 import extensions
+    from eventlet.hubs import trampoline
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+
+def enablePsycopg2():
+    """
+    Install the eventlet wait callback for every psycopg2 connection opened from now on.
+
+    Returns:
+        bool: True if the callback is (now) installed.
+    """
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    if extensions.get_wait_callback() is not eventletWaitCallback:
+        extensions.set_wait_callback(eventletWaitCallback)
+    return True
+
+
+@contextmanager
+def deadline(seconds, exception):
+    """
+    Raise `exception` if the `with` block (in this greenlet) runs longer than `seconds`.
+    libpq ignores connect_timeout in non-blocking mode, so green connects use this instead.
+    """
+    import eventlet
+    timeout = eventlet.Timeout(seconds)
+    try:
+        yield
+    except eventlet.Timeout as fired:
+        # Raised as itself first so driver-level `except OperationalError` retries can't swallow it
+        if fired is not timeout:
+            raise
+        raise exception
+    finally:
+        timeout.cancel()
+
+
+#######################################################################################
+# CONCURRENCY CHECK
+#######################################################################################
+def _measure(tasks, concurrency, seconds):
+    # Run `tasks` side by side while a ticker greenlet records how late the hub wakes it
+    import eventlet
+
+    lag = {'max': 0.0}
+    done = {'flag': False}
+
+    def ticker(interval=0.01):
+        while not done['flag']:
+            start = time.perf_counter()
+            eventlet.sleep(interval)
+            lag['max'] = max(lag['max'], time.perf_counter() - start - interval)
+
+    ticking = eventlet.spawn(ticker)
+    pool = eventlet.GreenPool(concurrency)
+    start = time.perf_counter()
+    for task in tasks:
+        pool.spawn(task)
+    pool.waitall()
+    wall = time.perf_counter() - start
+    done['flag'] = True
+    ticking.wait()
+
+    return {
+        'green': greenMode(),
+        'wall_seconds': round(wall, 3),
+        'max_tick_lag_ms': round(lag['max'] * 1000, 1),
+        'concurrent': wall < seconds * min(2, concurrency),
+    }
+
+
+def check(concurrency=5, seconds=1.0):
+    """
+    Show that a slow query does not serialize the worker: run `concurrency`
+    queries that each sleep `seconds` on the server from separate greenlets,
+    while a ticker greenlet measures how late the hub wakes it up.
+
+    With green drivers the queries overlap (wall time close to `seconds`)
+    and the ticker stays on time. With blocking drivers the wall time grows to
+    concurrency x seconds and the ticker stalls for a whole query.
+    Needs a reachable database; set DB_POOL_SIZE >= concurrency.
+
+    Returns:
+        dict: wall_seconds, max_tick_lag_ms, green and the verdict `concurrent`.
+    """
+    from .database import database
+
+    db = database(auto_migrate=False)
+    if db.backend == 'sqlite':
+        raise SystemExit("SQLite runs in-process; point DATABASE_URL at PostgreSQL or leave it unset for MySQL")
+    statement = "SELECT pg_sleep(%s)" if db.is_production else "SELECT SLEEP(%s)"
+    db.query("SELECT 1")  # open one connection before timing
+
+    tasks = [functools.partial(db.query, statement, (seconds,)) for _ in range(concurrency)]
+    return _measure(tasks, concurrency, seconds)
+
+
+class _SlowServerConnection:
+    """
+    Stands in for a psycopg2 connection waiting on a slow server. The
+    "server" is a real OS thread that answers on a socket after `seconds`;
+    until then poll() reports POLL_READ, as libpq does while a query runs.
+    """
+
+    def __init__(self, seconds):
+        from eventlet import patcher
+        from psycopg2 import extensions
+        self.extensions = extensions
+        # Unpatched modules: the server must really run outside the hub,
+        # like a database server, and the socket is a plain one like libpq's
+        socket = patcher.original('socket')
+        threading = patcher.original('threading')
+        sleep = patcher.original('time').sleep
+        self.client, server = socket.socketpair()
+        self.client.setblocking(False)
+
+        def answer():
+            sleep(seconds)
+            server.sendall(b'x')
+            server.close()
+
+        threading.Thread(target=answer, daemon=True).start()
+
+    def fileno(self):
+        return self.client.fileno()
+
+    def poll(self):
+        try:
+            self.client.recv(1)
+        except BlockingIOError:
+            return self.extensions.POLL_READ
+        self.client.close()
+        return self.extensions.POLL_OK
+
+
+def checkWaitCallback(concurrency=5, seconds=1.0, blocking=False):
+    """
+    The same check as check(), without a database: `concurrency` greenlets
+    each wait in eventletWaitCallback() on a local server that takes
+    `seconds` to answer. Proves the callback parks the greenlet instead of
+    stalling the hub. With `blocking` they wait in select() like libpq
+    without the callback, which should fail the check.
+
+    Returns:
+        dict: As check().
+    """
+    from eventlet import patcher
+    select = patcher.original('select').select
+
+    def wait():
+        conn = _SlowServerConnection(seconds)
+        if blocking:
+            while conn.poll() != conn.extensions.POLL_OK:
+                select([conn], [], [])
+        else:
+            eventletWaitCallback(conn)
+
+    return _measure([wait] * concurrency, concurrency, seconds)
+
+
+def main(argv=None):
+    """
+    Command line entry point. eventlet must have monkey-patched the process
+    before flask_app was imported, so run it through the top-level
+    `greencheck.py` rather than `python -m`.
+    """
+    parser = argparse.ArgumentParser(description='Check that slow queries do not block the eventlet hub.')
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--seconds', type=float, default=1.0)
+    parser.add_argument('--without-db', action='store_true',
+                        help='check the psycopg2 wait callback against a slow local server instead of a database')
+    parser.add_argument('--blocking', action='store_true', help='with --without-db: wait without the callback (should fail)')
+    args = parser.parse_args(argv)
+
+    if not eventletPatched():
+        raise SystemExit("eventlet is not patched in; run `python greencheck.py` from the repository root")
+    os.environ.setdefault('DB_POOL_SIZE', str(args.concurrency))
+
+    if args.without_db:
+        result = checkWaitCallback(args.concurrency, args.seconds, blocking=args.blocking)
+    else:
+        result = check(args.concurrency, args.seconds)
+    print(f"green drivers: {result['green']}")
+    print(f"{args.concurrency} x {args.seconds}s queries took {result['wall_seconds']}s, "
+          f"worst hub stall {result['max_tick_lag_ms']} ms")
+    print("OK: queries ran concurrently" if result['concurrent'] else "FAIL: queries were serialized")
+    return 0 if result['concurrent'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# One registry per process. Gunicorn forks its workers after the master has
+# imported the app, so every pool remembers the pid that created it and is
+# rebuilt (never shared) the first time it is used from a different process.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the pool timeout."""
+
+
+class PooledConnection:
+    """
+    Thin wrapper that remembers bookkeeping for one raw DB-API connection.
+    """
+
+    __slots__ = ('raw', 'created_at', 'last_used', 'statements', 'generation')
+
+    def __init__(self, raw, generation=0):
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used = now
+        # Per-connection statement cache (SQL text -> prepared statement name
+        # or cursor), valid while `generation` matches the pool's.
+        self.statements = {}
+        self.generation = generation
+
+    def resetStatements(self):
+        """
+        Forget the cached statements, closing those that hold a cursor.
+        """
+        for statement in self.statements.values():
+            if hasattr(statement, 'close'):
+                try:
+                    statement.close()
+                except Exception:
+                    pass
+        self.statements.clear()
+
+
+class ConnectionPool:
+    """
+    A bounded pool of DB-API connections.
+
+    Connections are created lazily up to `max_size`, health-checked with
+    `ping` when they have been idle for longer than `max_idle` seconds and
+    recycled once they are older than `max_lifetime` seconds. The pool only
+    relies on `threading` primitives, so it is green-thread safe when the
+    eventlet worker has monkey-patched the standard library.
+
+    Args:
+        connect (callable): Returns a new raw connection.
+        ping (callable): Takes a raw connection and raises if it is unusable.
+        max_size (int): Maximum number of open connections.
+        timeout (float): Seconds to wait for a free connection.
+        max_idle (float): Idle seconds after which a connection is pinged before reuse.
+        max_lifetime (float): Seconds after which a connection is closed and replaced.
+    """
+
+    def __init__(self, connect, ping, max_size=5, timeout=10.0, max_idle=30.0, max_lifetime=1800.0):
+        self.connect = connect
+        self.ping = ping
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.pid = os.getpid()
+
+        self._idle = []
+        self._size = 0
+        self._local = threading.local()
+        self._statement_generation = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'recycled': 0,
+            'errors': 0,
+        }
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a `with` block.
+
+        On a clean exit the connection is returned to the pool. If the block
+        raises, the transaction is rolled back and, if that fails too, the
+        connection is discarded instead of being handed to the next caller.
+        """
+        with self.session() as conn:
+            yield conn.raw
+
+    @contextmanager
+    def session(self):
+        """
+        Like connection(), but yields the PooledConnection itself so the
+        caller can use its statement cache. Inside pin() this is the pinned
+        connection.
+        """
+        pinned = getattr(self._local, 'pinned', None)
+        if pinned is not None:
+            try:
+                yield pinned
+            except BaseException:
+                self._stats['errors'] += 1
+                try:
+                    pinned.raw.rollback()
+                except Exception:
+                    pass
+                raise
+            return
+
+        conn = self._checkout()
+        try:
+            yield conn
+        except BaseException:
+            self._stats['errors'] += 1
+            try:
+                conn.raw.rollback()
+            except Exception:
+                self._discard(conn)
+                raise
+            self._checkin(conn)
+            raise
+        else:
+            self._checkin(conn)
+
+    @contextmanager
+    def pin(self):
+        """
+        Check out one connection and hand it to every session() and
+        connection() of this thread (greenlet, under eventlet) until the
+        block exits, so work done while holding a connection-level lock
+        needs no second connection (and can't time out with max_size=1).
+        """
+        with self.session() as conn:
+            self._local.pinned = conn
+            try:
+                yield conn
+            finally:
+                self._local.pinned = None
+
+    def stats(self):
+        """
+        Returns a snapshot of the pool counters plus current occupancy.
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['max_size'] = self.max_size
+        return stats
+
+    def invalidateStatements(self):
+        """
+        Drop every connection's statement cache, e.g. after DDL changed the
+        tables they refer to. Each connection resets itself at its next checkout.
+        """
+        with self._cond:
+            self._statement_generation += 1
+
+    def close(self):
+        """
+        Close every idle connection. Connections currently checked out are
+        closed when they are returned.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"No connection available after {self.timeout}s (max_size={self.max_size})")
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+
+                generation = self._statement_generation
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    # Reserve the slot before connecting outside the lock.
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = PooledConnection(self.connect(), generation)
+                except BaseException:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                self._stats['created'] += 1
+            elif not self._usable(conn):
+                self._discard(conn)
+                continue
+            elif conn.generation != generation:
+                conn.resetStatements()
+                conn.generation = generation
+
+            self._stats['checkouts'] += 1
+            return conn
+
+    def _usable(self, conn):
+        now = time.monotonic()
+        if now - conn.created_at > self.max_lifetime:
+            self._stats['recycled'] += 1
+            return False
+        if now - conn.last_used > self.max_idle:
+            try:
+                self.ping(conn.raw)
+            except Exception:
+                self._stats['health_check_failures'] += 1
+                return False
+        return True
+
+    def _checkin(self, conn):
+        conn.last_used = time.monotonic()
+        if conn.last_used - conn.created_at > self.max_lifetime:
+            self._stats['recycled'] += 1
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def _discard(self, conn):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        self._close(conn)
+
+    def _close(self, conn):
+        self._stats['closed'] += 1
+        try:
+            conn.raw.close()
+        except Exception:
+            pass
+
+
+def getPool(key, connect, ping):
+    """
+    Returns the pool for `key` in the current process, creating it on first use.
+
+    Pool limits are read from the environment:
+        DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_MAX_IDLE, DB_POOL_MAX_LIFETIME
+    """
+    pid = os.getpid()
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != pid:
+            # A pool inherited across fork() holds sockets owned by the
+            # parent; drop it without closing so the parent is unaffected.
+            pool = ConnectionPool(
+                connect=connect,
+                ping=ping,
+                max_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+                timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                max_idle=float(os.environ.get('DB_POOL_MAX_IDLE', 30)),
+                max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+            )
+            _pools[key] = pool
+        return pool
+
+
+def poolStats():
+    """
+    Returns the stats of every pool owned by the current process, keyed by pool key.
+    """
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [(key, pool) for key, pool in _pools.items() if pool.pid == pid]
+    return {'/'.join(str(k) for k in key): pool.stats() for key, pool in pools}
@@ -0,0 +1,182 @@
+import os
+import re
+import fcntl
+import sqlite3
+import datetime
+from functools import lru_cache
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# An embedded stand-in for the MySQL/PostgreSQL servers, selected with
+# DATABASE_URL=sqlite:///path/to/file.db. It runs the same SQL the app sends
+# to the real servers (format-style %s parameters, SERIAL keys), so
+# benchmarks and local runs need no database server.
+
+Error = sqlite3.Error
+OperationalError = sqlite3.OperationalError
+
+_LITERAL_OR_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|%s|%%")
+_DDL_RULES = [
+    (re.compile(r'\bSERIAL\s+PRIMARY\s+KEY\b', re.IGNORECASE), 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (re.compile(r'\bSERIAL\b', re.IGNORECASE), 'INTEGER'),
+]
+
+
+def _convertDate(value):
+    try:
+        return datetime.date.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode()
+
+
+def _convertTimestamp(value):
+    try:
+        return datetime.datetime.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode()
+
+
+# Read DATE/TIMESTAMP columns back as date/datetime objects, like the other drivers
+sqlite3.register_converter('DATE', _convertDate)
+sqlite3.register_converter('TIMESTAMP', _convertTimestamp)
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(' '))
+
+
+@lru_cache(maxsize=1024)
+def translate(query):
+    """
+    Rewrite a statement written for psycopg2/mysql.connector into SQLite:
+    %s placeholders become ?, %% becomes %, SERIAL columns become
+    INTEGER PRIMARY KEY AUTOINCREMENT. String literals are left untouched.
+    """
+    def replace(match):
+        token = match.group(0)
+        if token == '%s':
+            return '?'
+        if token == '%%':
+            return '%'
+        return token
+    query = _LITERAL_OR_PLACEHOLDER.sub(replace, query)
+    for pattern, replacement in _DDL_RULES:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+def pathFromUrl(url):
+    """
+    Returns the database file for 'sqlite:///relative.db' or 'sqlite:////absolute.db'.
+    """
+    parsed = urlparse(url)
+    path = (parsed.netloc + parsed.path)[1:] if parsed.path.startswith('/') else parsed.path
+    return path or ':memory:'
+
+
+def _dictRow(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class Cursor:
+    """
+    DB-API cursor returning dict rows (plain tuples with dictionary=False)
+    and accepting %s parameters.
+    """
+
+    def __init__(self, raw, dictionary=True):
+        self.raw = raw
+        if not dictionary:
+            self.raw.row_factory = None
+
+    def execute(self, query, parameters=None):
+        self.raw.execute(translate(query), tuple(parameters) if parameters is not None else ())
+        return self
+
+    def executemany(self, query, rows):
+        self.raw.executemany(translate(query), [tuple(row) for row in rows])
+        return self
+
+    def fetchall(self):
+        return self.raw.fetchall()
+
+    def fetchmany(self, size=None):
+        return self.raw.fetchmany(size or self.raw.arraysize)
+
+    def fetchone(self):
+        return self.raw.fetchone()
+
+    @property
+    def description(self):
+        return self.raw.description
+
+    @property
+    def rowcount(self):
+        return self.raw.rowcount
+
+    @property
+    def lastrowid(self):
+        return self.raw.lastrowid
+
+    def close(self):
+        self.raw.close()
+
+
+class Connection:
+    """
+    A sqlite3 connection behaving like the server drivers' connections:
+    dict rows, %s parameters, foreign keys enforced, WAL journaling so
+    readers don't block the writer, and waits of up to `timeout` seconds
+    for the write lock. sqlite3 keeps up to `cached_statements` compiled
+    statements per connection, so repeated SQL is only parsed once.
+    """
+
+    def __init__(self, path, timeout=10.0, cached_statements=128):
+        self.path = path
+        self.raw = sqlite3.connect(path, timeout=timeout, detect_types=sqlite3.PARSE_DECLTYPES,
+                                   check_same_thread=False, cached_statements=cached_statements)
+        self.raw.row_factory = _dictRow
+        self.raw.execute("PRAGMA foreign_keys = ON")
+        if path != ':memory:':
+            self.raw.execute("PRAGMA journal_mode = WAL")
+            self.raw.execute("PRAGMA synchronous = NORMAL")
+        self.closed = False
+
+    def cursor(self, dictionary=True):
+        return Cursor(self.raw.cursor(), dictionary=dictionary)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.closed = True
+        self.raw.close()
+
+
+def connect(url, timeout=10.0, cached_statements=128):
+    """
+    Open a Connection for a sqlite:// URL, creating the file's directory if needed.
+    """
+    path = pathFromUrl(url)
+    if path != ':memory:' and os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    return Connection(path, timeout=timeout, cached_statements=cached_statements)
+
+
+@contextmanager
+def fileLock(url):
+    """
+    Serialize migrations across processes with an flock on `<file>.migrate.lock`.
+    (A lock held inside SQLite would block the migration's own writes.)
+    """
+    path = pathFromUrl(url)
+    if path == ':memory:':
+        yield
+        return
+    with open(path + '.migrate.lock', 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import argparse
+
+# Tables that can be exported, with the increasing key used for ordering and
+# for resuming an interrupted export (`after`).
+EXPORT_TABLES = {
+    'feedback': 'comment_id',
+    'users': 'id',
+    'chat_messages': 'message_id',
+}
+# Tables that may be downloaded over HTTP; `users` holds password hashes
+# and is only exported from the command line.
+HTTP_EXPORT_TABLES = ('feedback', 'chat_messages')
+FORMATS = ('csv', 'ndjson')
+MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def csvValue(value):
+    """
+    Format one value like flask_app/database/initial_data/: every value
+    quoted (quotes doubled), numbers included, and a bare NULL for missing values.
+    """
+    if value is None:
+        return 'NULL'
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def csvLine(values):
+    return ",".join(csvValue(value) for value in values) + "\n"
+
+
+def ndjsonLine(columns, row):
+    return json.dumps(dict(zip(columns, row)), default=str) + "\n"
+
+
+def exportChunks(db, table, fmt='csv', after=None, batch_size=1000, header=True):
+    """
+    Stream `table` in key order as CSV or NDJSON, one text chunk per batch of
+    `batch_size` rows, so memory use does not grow with the table.
+
+    Args:
+        db (database): Where to read from.
+        table (str): One of EXPORT_TABLES.
+        fmt (str): 'csv' or 'ndjson'.
+        after (int): Only export rows whose key is greater (a checkpoint).
+        batch_size (int): Rows per database round trip and per chunk.
+        header (bool): Start CSV output with the column names; turn off when
+            appending to an earlier export.
+
+    Yields:
+        tuple: (text, last_key) where last_key is the checkpoint to resume
+               after once `text` has been written (None for an empty chunk).
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown export table {table!r}; expected one of {', '.join(EXPORT_TABLES)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+    key = EXPORT_TABLES[table]
+    if after is None:
+        query, parameters = f"SELECT * FROM {table} ORDER BY {key}", None
+    else:
+        query, parameters = f"SELECT * FROM {table} WHERE {key} > %s ORDER BY {key}", (after,)
+
+    first = True
+    for columns, batch in db.streamQuery(query, parameters, batch_size=batch_size):
+        lines = []
+        if first and header and fmt == 'csv':
+            lines.append(",".join(f'"{column}"' for column in columns) + "\n")
+        first = False
+        position = columns.index(key)
+        if fmt == 'csv':
+            lines.extend(csvLine(row) for row in batch)
+        else:
+            lines.extend(ndjsonLine(columns, row) for row in batch)
+        yield "".join(lines), (batch[-1][position] if batch else None)
+
+
+def readCheckpoint(path):
+    """
+    Returns the checkpoint saved next to an export file, or None.
+    """
+    try:
+        with open(path + '.checkpoint') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def exportToFile(db, table, path, fmt='csv', batch_size=1000, resume=False):
+    """
+    Write an export to `path`, recording after every batch a checkpoint in
+    `<path>.checkpoint` (the last key and the file size at that point). With
+    `resume`, a partial trailing batch is cut off and the export continues
+    after the checkpoint.
+
+    Returns:
+        dict: The final checkpoint.
+    """
+    checkpoint = readCheckpoint(path) if resume else None
+    if checkpoint and (checkpoint['table'], checkpoint['format']) != (table, fmt):
+        raise ValueError(f"{path} holds a {checkpoint['format']} export of {checkpoint['table']}")
+    if checkpoint is None:
+        checkpoint = {'table': table, 'format': fmt, 'after': None, 'bytes': 0}
+
+    with open(path, 'r+b' if checkpoint['bytes'] else 'wb') as out:
+        out.truncate(checkpoint['bytes'])
+        out.seek(checkpoint['bytes'])
+        chunks = exportChunks(db, table, fmt=fmt, after=checkpoint['after'],
+                              batch_size=batch_size, header=not checkpoint['bytes'])
+        for text, last_key in chunks:
+            data = text.encode('utf-8')
+            out.write(data)
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint['bytes'] += len(data)
+            if last_key is not None:
+                checkpoint['after'] = last_key
+            _writeCheckpoint(path, checkpoint)
+    return checkpoint
+
+
+def _writeCheckpoint(path, checkpoint):
+    tmp = path + '.checkpoint.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path + '.checkpoint')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stream a table to CSV (initial_data format) or NDJSON.')
+    parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--output', help='file to write; a .checkpoint file is kept next to it (default: stdout)')
+    parser.add_argument('--resume', action='store_true', help='continue the export in --output after its checkpoint')
+    parser.add_argument('--after', type=int, help='only export rows with a greater key (stdout only)')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    from ..database.database import database
+    db = database(auto_migrate=False)
+
+    if args.output:
+        result = exportToFile(db, args.table, args.output, fmt=args.format, batch_size=args.batch_size, resume=args.resume)
+        print(f"exported {args.table} through {EXPORT_TABLES[args.table]}={result['after']} ({result['bytes']} bytes)", file=sys.stderr)
+    else:
+        for text, _ in exportChunks(db, args.table, fmt=args.format, after=args.after, batch_size=args.batch_size,
+                                    header=args.after is None):
+            sys.stdout.write(text)
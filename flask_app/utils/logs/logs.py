@@ -0,0 +1,202 @@
+import os
+import sys
+import copy
+import json
+import time
+import atexit
+import importlib
+import logging
+import threading
+import logging.handlers
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+# and becomes a field of the JSON line.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_state = {'pid': None, 'listener': None}
+_state_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, msg, any `extra=` fields and,
+    for exceptions, the formatted traceback under `exc`.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        # Records that went through _QueueHandler carry the traceback pre-formatted
+        exc = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        if exc:
+            entry['exc'] = exc
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Human-readable lines for local development, with `extra=` fields appended as key=value.
+    """
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s', '%H:%M:%S')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = [f"{key}={value}" for key, value in record.__dict__.items()
+                  if key not in _RECORD_ATTRIBUTES and not key.startswith('_')]
+        return line + (' ' + ' '.join(fields) if fields else '')
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through at most `burst` records per `window` seconds for each
+    (logger, message template) pair and drops the rest, so an error repeated
+    on every request logs a few lines instead of thousands. The next record
+    that gets through carries `suppressed` = how many were dropped.
+
+    Records below `level` are never sampled.
+    """
+
+    def __init__(self, burst=10, window=60.0, level=logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.level = level
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level or self.burst <= 0:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else repr(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            started, count, suppressed = self._seen.get(key, (now, 0, 0))
+            if now - started >= self.window:
+                started, count = now, 0
+            if count >= self.burst:
+                self._seen[key] = (started, count, suppressed + 1)
+                return False
+            self._seen[key] = (started, count + 1, 0)
+            if len(self._seen) > 10000:
+                self._seen.clear()
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that keeps the traceback in `exc_text` (formatted now, while
+    the frames are alive) instead of folding it into the message as the
+    stock prepare() does, so JsonFormatter can emit it under `exc`.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def _unpatched(name):
+    # The standard module as it was before eventlet's monkey-patching, if any
+    eventlet = sys.modules.get('eventlet')
+    if eventlet is not None:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread'):
+            return patcher.original(name)
+    return importlib.import_module(name)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener on a real OS thread. Under eventlet a patched thread is a
+    greenlet, and its stdout writes would block the hub like any other
+    request code.
+    """
+
+    def start(self):
+        self._thread = _unpatched('threading').Thread(target=self._monitor, name='log-writer', daemon=True)
+        self._thread.start()
+
+
+def configure(force=False):
+    """
+    Set up the `flask_app` logger once per process.
+
+    Records are put on an in-memory queue by a QueueHandler and written by a
+    listener on a real OS thread (even under eventlet), so the request path
+    never blocks on stdout.
+
+    Configured with LOG_LEVEL (default INFO; DEBUG turns on the startup
+    diagnostics), LOG_FORMAT ('json', default, or 'text'), LOG_SAMPLE_BURST
+    and LOG_SAMPLE_WINDOW (0 burst disables sampling).
+    """
+    with _state_lock:
+        # A forked worker inherits the handlers but not the listener thread.
+        if _state['pid'] == os.getpid() and not force:
+            return
+        if _state['listener'] is not None and _state['pid'] == os.getpid():
+            _state['listener'].stop()
+
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(TextFormatter() if os.environ.get('LOG_FORMAT', 'json') == 'text' else JsonFormatter())
+
+        # Shared with the listener's OS thread, so it must use real locks too
+        records = _unpatched('queue').Queue(-1)
+        handler = _QueueHandler(records)
+        handler.addFilter(SamplingFilter(
+            burst=int(os.environ.get('LOG_SAMPLE_BURST', 10)),
+            window=float(os.environ.get('LOG_SAMPLE_WINDOW', 60))
+        ))
+
+        root = logging.getLogger('flask_app')
+        root.handlers = [handler]
+        root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+        root.propagate = False
+
+        listener = _QueueListener(records, stream, respect_handler_level=True)
+        listener.start()
+        if _state['pid'] is None:
+            atexit.register(_stop)
+        _state.update(pid=os.getpid(), listener=listener)
+
+
+def _stop():
+    listener = _state['listener']
+    if listener is not None and _state['pid'] == os.getpid():
+        listener.stop()
+        _state['listener'] = None
+
+
+def _afterFork():
+    if _state['pid'] is not None:
+        configure()
+
+
+os.register_at_fork(after_in_child=_afterFork)
+
+
+def getLogger(name):
+    """
+    Returns a logger under the `flask_app` hierarchy, configuring logging on first use.
+
+    Args:
+        name (str): Usually `__name__` of the calling module.
+    """
+    configure()
+    if name != 'flask_app' and not name.startswith('flask_app.'):
+        name = 'flask_app.' + name
+    return logging.getLogger(name)
@@ -0,0 +1,266 @@
+import os
+import hmac
+import time
+import uuid
+import cProfile
+import functools
+import tempfile
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Every metric in this process, by name. Each gunicorn worker keeps its own
+# registry, so a scrape reports the worker that happened to answer it.
+_registry = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labelText(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """
+    A monotonically increasing value per label combination.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labelText(self.labels, key)} {value}" for key, value in values]
+
+
+class Histogram:
+    """
+    Observations counted into cumulative buckets per label combination.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+                    break
+            counts[1] += value
+            counts[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the wall time spent in a `with` block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def total(self):
+        """
+        Returns the number of observations across every label combination.
+        """
+        with self._lock:
+            return sum(counts[2] for counts in self._values.values())
+
+    def render(self):
+        with self._lock:
+            values = [(key, list(counts[0]), counts[1], counts[2]) for key, counts in self._values.items()]
+        lines = []
+        for key, buckets, total, count in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets, buckets):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labelText(self.labels, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labelText(self.labels, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_labelText(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_labelText(self.labels, key)} {count}")
+        return lines
+
+
+def _register(cls, name, help, labels, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, help, labels, **kwargs)
+        return metric
+
+
+def counter(name, help, labels=()):
+    """
+    Returns the process-wide Counter called `name`, creating it on first use.
+    """
+    return _register(Counter, name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    """
+    Returns the process-wide Histogram called `name`, creating it on first use.
+    """
+    return _register(Histogram, name, help, labels, buckets=buckets)
+
+
+def registerCollector(collect):
+    """
+    Register a callable evaluated at scrape time. It returns a list of
+    (name, help, {label: value}, number) tuples exported as gauges; use it
+    for stats other components already keep (pool, caches, queues).
+    """
+    _collectors.append(collect)
+
+
+def render():
+    """
+    Returns every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render())
+
+    gauges = {}
+    for collect in _collectors:
+        try:
+            for name, help, labels, value in collect():
+                gauges.setdefault(name, (help, []))[1].append((labels, value))
+        except Exception as e:
+            lines.append(f"# collector failed: {_escape(e)}")
+    for name, (help, samples) in gauges.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(f"{name}{_labelText(labels.keys(), labels.values())} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Metrics shared by the hot paths
+request_seconds = histogram('http_request_duration_seconds', 'Time spent handling HTTP requests.', ('method', 'route', 'status'))
+query_seconds = histogram('db_query_duration_seconds', 'Time spent executing database statements.', ('operation', 'table'))
+query_rows = counter('db_query_rows_total', 'Rows returned or written by database statements.', ('operation', 'table'))
+connect_seconds = histogram('db_connection_open_seconds', 'Time spent opening new database connections.', ('backend',))
+password_seconds = histogram('password_hash_duration_seconds', 'Time spent in scrypt.', ('operation',))
+socketio_seconds = histogram('socketio_event_duration_seconds', 'Time spent handling Socket.IO events.', ('namespace', 'event'))
+
+
+def timedEvent(namespace, event):
+    """
+    Decorator recording how long a Socket.IO event handler takes.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def timed(*args, **kwargs):
+            with socketio_seconds.time(namespace=namespace, event=event):
+                return handler(*args, **kwargs)
+        return timed
+    return decorator
+
+
+def init_app(app):
+    """
+    Time every request, serve /metrics, and enable the opt-in profiler.
+
+    /metrics, and profiling on request, are only for clients sending
+    `Authorization: Bearer <METRICS_TOKEN>`; without METRICS_TOKEN they are
+    closed to everyone (session roles are self-assigned at registration).
+
+    Profiling is controlled by PROFILE_REQUESTS: 'off' (default), 'header'
+    (only authorized requests sent with `X-Profile: 1`) or 'always'
+    (development only). One request is profiled at a time per worker; a
+    request that finds the profiler busy is served unprofiled with
+    `X-Profile-Skipped: busy`. Each profiled request writes a cProfile dump
+    to PROFILE_DIR and names it in the X-Profile-File response header;
+    inspect it with `python -m pstats`.
+    """
+    from flask import g, request, Response
+
+    mode = os.environ.get('PROFILE_REQUESTS', 'off')
+    profile_dir = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'personalsite-profiles'))
+    token = os.environ.get('METRICS_TOKEN')
+    # Under eventlet every request runs on the same OS thread, so two
+    # profilers would collect each other's calls; profile one at a time
+    profiling = threading.Lock()
+
+    def authorized():
+        return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+
+    def stopProfiler():
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            profiling.release()
+        return profiler
+
+    @app.before_request
+    def startTimer():
+        g.request_started = time.perf_counter()
+        if mode == 'always' or (mode == 'header' and request.headers.get('X-Profile') == '1' and authorized()):
+            if profiling.acquire(blocking=False):
+                g.profiler = cProfile.Profile()
+                g.profiler.enable()
+            else:
+                g.profile_skipped = True
+
+    @app.after_request
+    def stopTimer(response):
+        profiler = stopProfiler()
+        if profiler is not None:
+            os.makedirs(profile_dir, mode=0o700, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{os.getpid()}-{uuid.uuid4().hex[:8]}.prof"
+            path = os.path.join(profile_dir, name)
+            profiler.dump_stats(path)
+            response.headers['X-Profile-File'] = path
+        elif g.pop('profile_skipped', False):
+            response.headers['X-Profile-Skipped'] = 'busy'
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            request_seconds.observe(time.perf_counter() - started, method=request.method, route=route, status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def releaseProfiler(error=None):
+        # after_request does not run when the view raised
+        stopProfiler()
+
+    @app.route('/metrics')
+    def metrics():
+        if not authorized():
+            return Response("Forbidden", status=403, mimetype='text/plain')
+        return Response(render(), mimetype='text/plain; version=0.0.4')
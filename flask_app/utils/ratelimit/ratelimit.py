@@ -0,0 +1,152 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from ..cache.cache import cacheDirectory, SharedSQLite
+
+
+class MemoryBackend:
+    """
+    Keeps token buckets in process memory. The number of tracked keys is
+    bounded; the least recently used bucket is forgotten first, which at
+    worst hands an idle key a full bucket again.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed, tokens
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def sweep(self, capacity, rate, now=None):
+        """
+        Forget buckets that have refilled completely. Returns how many were removed.
+        """
+        now = now or time.time()
+        with self._lock:
+            full = [key for key, (tokens, stamp) in self._buckets.items() if tokens + (now - stamp) * rate >= capacity]
+            for key in full:
+                del self._buckets[key]
+        return len(full)
+
+
+class SQLiteBackend:
+    """
+    Keeps token buckets in a SQLite file so every gunicorn worker on the host
+    shares the same limits. Each take() is one short IMMEDIATE transaction.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cacheDirectory(), 'ratelimit.sqlite3')
+        self.db = SharedSQLite(self.path, setup=[
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL)",
+        ])
+
+    def take(self, key, capacity, rate, now):
+        with self.db.connection() as cnx:
+            cnx.execute("BEGIN IMMEDIATE")
+            try:
+                row = cnx.execute("SELECT tokens, stamp FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, stamp = row if row else (capacity, now)
+                tokens = min(capacity, tokens + (now - stamp) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                cnx.execute("INSERT OR REPLACE INTO buckets (key, tokens, stamp) VALUES (?, ?, ?)", (key, tokens, now))
+                cnx.execute("COMMIT")
+            except BaseException:
+                cnx.execute("ROLLBACK")
+                raise
+        return allowed, tokens
+
+    def reset(self, key):
+        with self.db.connection() as cnx:
+            cnx.execute("DELETE FROM buckets WHERE key = ?", (key,))
+
+    def sweep(self, capacity, rate, now=None):
+        """
+        Delete buckets that have refilled completely; they carry no information.
+        Returns how many were removed.
+        """
+        now = now or time.time()
+        with self.db.connection() as cnx:
+            return cnx.execute("DELETE FROM buckets WHERE tokens + (? - stamp) * ? >= ?", (now, rate, capacity)).rowcount
+
+    def close(self):
+        self.db.close()
+
+
+class RateLimiter:
+    """
+    A token-bucket rate limiter: each key may make `capacity` calls in a
+    burst and regains one call every `per / capacity` seconds.
+
+    Args:
+        capacity (int): Burst size (calls allowed with a full bucket).
+        per (float): Seconds to refill an empty bucket completely.
+        backend: MemoryBackend (default) or SQLiteBackend.
+        sweep_interval (float): Seconds between sweeps of full buckets.
+    """
+
+    def __init__(self, capacity=5, per=60.0, backend=None, sweep_interval=300.0):
+        self.capacity = capacity
+        self.per = per
+        self.rate = capacity / per
+        self.backend = backend or MemoryBackend()
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def hit(self, key):
+        """
+        Consume one call for `key`.
+
+        Returns:
+            tuple: (allowed, retry_after) where retry_after is the number of
+                   seconds until the next call would be allowed (0 if allowed).
+        """
+        self._maybeSweep()
+        allowed, tokens = self.backend.take(key, self.capacity, self.rate, time.time())
+        if allowed:
+            return True, 0
+        return False, (1 - tokens) / self.rate
+
+    def reset(self, key):
+        """
+        Give `key` a full bucket again.
+        """
+        self.backend.reset(key)
+
+    def _maybeSweep(self):
+        if time.monotonic() < self._next_sweep:
+            return
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        self.backend.sweep(self.capacity, self.rate)
+
+
+def limiterFromEnv(name, default='5/60'):
+    """
+    Build a RateLimiter from an environment variable of the form
+    "<calls>/<seconds>" (e.g. LOGIN_RATE_LIMIT=5/60). RATE_LIMIT_BACKEND
+    selects "memory" (per worker, default) or "sqlite" (shared by all
+    workers on the host); RATE_LIMIT_SWEEP_INTERVAL is how often (seconds)
+    full buckets are dropped.
+    """
+    calls, seconds = os.environ.get(name, default).split('/')
+    backend = SQLiteBackend() if os.environ.get('RATE_LIMIT_BACKEND') == 'sqlite' else MemoryBackend()
+    return RateLimiter(capacity=int(calls), per=float(seconds), backend=backend,
+                       sweep_interval=float(os.environ.get('RATE_LIMIT_SWEEP_INTERVAL', 300)))
@@ -0,0 +1,378 @@
+import os
+import sys
+import time
+import secrets
+import argparse
+import threading
+from collections import OrderedDict
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from ..cache.cache import cacheDirectory, LRUCache, SharedSQLite
+
+# Server-side sessions: the cookie only carries an opaque, random session id
+# and the data stays on the server, so requests don't carry (and re-verify) a
+# signed payload and a session can be revoked by deleting its record.
+
+
+class MemoryStore:
+    """
+    Keeps sessions in process memory, least recently used evicted first.
+    Only suitable for a single worker process.
+    """
+
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, sid, now):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None or entry[1] <= now:
+                return None
+            self._sessions.move_to_end(sid)
+            return entry
+
+    def save(self, sid, blob, expires):
+        with self._lock:
+            self._sessions[sid] = (blob, expires)
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def sweep(self, now=None):
+        """
+        Delete every expired session. Returns how many were removed.
+        """
+        now = now or time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires) in self._sessions.items() if expires <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+    def stats(self):
+        return {'sessions': len(self._sessions)}
+
+
+class SQLiteStore:
+    """
+    Keeps sessions in a SQLite file so every gunicorn worker on the host
+    shares them, with an in-process LRU in front. A worker may serve a
+    session from its LRU for up to `cache_ttl` seconds after another worker
+    changed or revoked it; changes made through the same worker are seen at once.
+    """
+
+    def __init__(self, path=None, cache_size=10000, cache_ttl=5.0):
+        self.path = path or os.path.join(cacheDirectory(), 'sessions.sqlite3')
+        self.cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self.db = SharedSQLite(self.path, setup=[
+            "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)",
+        ])
+
+    def load(self, sid, now):
+        entry = self.cache.get(sid)
+        if entry is None:
+            with self.db.connection() as cnx:
+                entry = cnx.execute("SELECT data, expires FROM sessions WHERE sid = ?", (sid,)).fetchone()
+            if entry is None:
+                return None
+            self.cache.set(sid, entry)
+        return entry if entry[1] > now else None
+
+    def save(self, sid, blob, expires):
+        with self.db.connection() as cnx:
+            cnx.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)", (sid, blob, expires))
+        self.cache.set(sid, (blob, expires))
+
+    def delete(self, sid):
+        with self.db.connection() as cnx:
+            cnx.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        self.cache.pop(sid)
+
+    def sweep(self, now=None):
+        """
+        Delete every expired session in one statement. Returns how many were removed.
+        """
+        now = now or time.time()
+        with self.db.connection() as cnx:
+            return cnx.execute("DELETE FROM sessions WHERE expires <= ?", (now,)).rowcount
+
+    def close(self):
+        self.db.close()
+
+    def stats(self):
+        with self.db.connection() as cnx:
+            stats = {'sessions': cnx.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]}
+        stats.update({f"cache_{name}": value for name, value in self.cache.stats().items()})
+        return stats
+
+
+class ServerSession(SessionMixin):
+    """
+    The `session` object for one request. Nothing is read from the store
+    until the request first touches the session, so routes that never look
+    at it cost no lookup.
+    """
+
+    def __init__(self, sid, load):
+        self.sid = sid
+        self.presented = sid  # the id the client sent, even if it turned out unknown
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.regenerated = False
+        self._load = load
+        self._data = None
+        self._expires = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.accessed = True
+            self._data, self._expires = self._load(self.sid) if self.sid else ({}, None)
+            if self._expires is None:
+                # Unknown or expired id (possibly planted by someone else):
+                # anything saved from now on gets a fresh one
+                self.sid = None
+        return self._data
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        self.data  # resolve the id first, so an unknown one is not reused
+        self._data, self.modified, self.accessed = {}, True, True
+
+    def regenerate(self):
+        """
+        Move the data to a fresh session id when the response is saved (call
+        on login, so an id planted before authentication is worthless).
+        """
+        self.data  # load under the old id first
+        self.regenerated = True
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """
+    Flask session interface storing session data in `store` (MemoryStore or
+    SQLiteStore) under an opaque id sent as the session cookie.
+
+    Args:
+        store: Where session data lives.
+        ttl (float): Seconds a session lives without being saved again; it
+            is extended when a request finds less than half of it left.
+        sweep_interval (float): Seconds between expiry sweeps in each worker.
+    """
+
+    def __init__(self, store, ttl=7 * 86400, sweep_interval=300.0):
+        self.store = store
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._stats = {'loads': 0, 'misses': 0, 'saves': 0, 'deletes': 0, 'swept': 0}
+        # The same tagged JSON Flask uses for cookie sessions; never pickle,
+        # the store is a file other local users might manage to write
+        self.serializer = TaggedJSONSerializer()
+
+    def open_session(self, app, request):
+        return ServerSession(request.cookies.get(self.get_cookie_name(app)), self._loadData)
+
+    def _loadData(self, sid):
+        self._stats['loads'] += 1
+        entry = self.store.load(sid, time.time())
+        if entry is None:
+            self._stats['misses'] += 1
+            return {}, None
+        try:
+            return self.serializer.loads(entry[0]), entry[1]
+        except ValueError:
+            self._stats['misses'] += 1
+            return {}, None
+
+    def save_session(self, app, session, response):
+        self._maybeSweep()
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.loaded and not session:
+            # Cleared (e.g. logout): revoke the record, not just the cookie
+            if session.sid is not None:
+                self.store.delete(session.sid)
+                self._stats['deletes'] += 1
+            if session.presented is not None:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        stale = session._expires is not None and session._expires - now < self.ttl / 2
+        if not (session.modified or stale):
+            return
+
+        if session.regenerated and session.sid is not None:
+            self.store.delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), now + self.ttl)
+        self._stats['saves'] += 1
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def _maybeSweep(self):
+        if time.monotonic() < self._next_sweep:
+            return
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        self._stats['swept'] += self.store.sweep()
+
+    def revoke(self, sid):
+        """
+        End the session `sid` immediately.
+        """
+        self.store.delete(sid)
+        self._stats['deletes'] += 1
+
+    def stats(self):
+        """
+        Returns load/miss/save/delete/sweep counters for this worker plus the store's own.
+        """
+        stats = dict(self._stats)
+        stats.update(self.store.stats())
+        return stats
+
+
+def init_app(app):
+    """
+    Install the session backend named by SESSION_BACKEND: "sqlite" (default,
+    shared by the workers on the host), "memory" (single worker) or "cookie"
+    (Flask's signed cookie). SESSION_TTL and SESSION_SWEEP_INTERVAL are in seconds.
+
+    Returns:
+        ServerSessionInterface, or None for cookie sessions.
+    """
+    backend = os.environ.get('SESSION_BACKEND', 'sqlite')
+    if backend == 'cookie':
+        return None
+    if backend == 'memory':
+        store = MemoryStore(max_sessions=int(os.environ.get('SESSION_CACHE_SIZE', 10000)))
+    else:
+        store = SQLiteStore(cache_size=int(os.environ.get('SESSION_CACHE_SIZE', 10000)),
+                            cache_ttl=float(os.environ.get('SESSION_CACHE_TTL', 5)))
+    app.session_interface = ServerSessionInterface(
+        store,
+        ttl=float(os.environ.get('SESSION_TTL', 7 * 86400)),
+        sweep_interval=float(os.environ.get('SESSION_SWEEP_INTERVAL', 300))
+    )
+    return app.session_interface
+
+
+#######################################################################################
+# BENCHMARK
+#######################################################################################
+def benchmark(interfaces, requests=5000):
+    """
+    Measure the session overhead of one request (open the session, read it,
+    save it) for each interface, for a logged-in visitor.
+
+    Returns:
+        list: [{'backend', 'read_us', 'write_us', 'anonymous_us', 'cookie_bytes'}, ...]
+    """
+    from flask import Flask, request as current_request
+
+    results = []
+    for label, interface in interfaces.items():
+        app = Flask(__name__)
+        app.secret_key = 'benchmark'
+        if interface is not None:
+            app.session_interface = interface
+        name = app.config['SESSION_COOKIE_NAME']
+
+        with app.test_request_context('/processlogin'):
+            session = app.session_interface.open_session(app, current_request)
+            session.update({'email': 'gAAAAAB' + 'x' * 130, 'name': 'Owner', 'role': 'owner', 'failed_attempts': 0})
+            response = app.response_class()
+            app.session_interface.save_session(app, session, response)
+            cookie = response.headers['Set-Cookie'].split(';', 1)[0].split('=', 1)[1]
+
+        def run(cookie, write):
+            environ = app.test_request_context('/chat', headers={'Cookie': f"{name}={cookie}"} if cookie else {}).request.environ
+            start = time.perf_counter()
+            for i in range(requests):
+                request = app.request_class(environ)
+                session = app.session_interface.open_session(app, request)
+                if cookie:
+                    session.get('role')
+                if write:
+                    session['failed_attempts'] = i
+                app.session_interface.save_session(app, session, app.response_class())
+            return round((time.perf_counter() - start) / requests * 1e6, 2)
+
+        results.append({
+            'backend': label,
+            'read_us': run(cookie, False),
+            'write_us': run(cookie, True),
+            'anonymous_us': run(None, False),
+            'cookie_bytes': len(cookie),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Sweep expired sessions, or compare session backends.')
+    parser.add_argument('--sweep', action='store_true', help='delete expired sessions from the shared store')
+    parser.add_argument('--benchmark', action='store_true', help='compare cookie and server-side sessions')
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.sweep:
+        print(f"removed {SQLiteStore().sweep()} expired sessions")
+    if args.benchmark:
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(prefix='sessions-bench-'), 'sessions.sqlite3')
+        interfaces = {
+            'cookie': None,
+            'memory': ServerSessionInterface(MemoryStore()),
+            'sqlite (LRU hit)': ServerSessionInterface(SQLiteStore(path)),
+            'sqlite (no LRU)': ServerSessionInterface(SQLiteStore(path, cache_ttl=0)),
+        }
+        print(f"{'backend':18} {'read us':>8} {'write us':>9} {'anon us':>8} {'cookie bytes':>12}")
+        for result in benchmark(interfaces, args.requests):
+            print(f"{result['backend']:18} {result['read_us']:>8} {result['write_us']:>9} "
+                  f"{result['anonymous_us']:>8} {result['cookie_bytes']:>12}")
+    if not (args.sweep or args.benchmark):
+        parser.print_help()
+        sys.exit(1)
@@ -0,0 +1,246 @@
+import os
+import glob
+import json
+import time
+import queue
+import atexit
+import threading
+from ..cache.cache import cacheDirectory
+from ..logs.logs import getLogger
+
+log = getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Accepts rows into a bounded in-process queue and writes them in batches
+    from a background worker, so request handlers don't wait on the database.
+
+    The worker is a regular thread, which the eventlet worker turns into a
+    greenlet. It is started lazily on the first submit() so that it runs in
+    the gunicorn worker rather than in the pre-fork master. Rows still queued
+    at interpreter exit are spilled to `<spill_dir>/<name>-<pid>.ndjson` and
+    re-queued by whichever process starts next.
+
+    Args:
+        flush (callable): Writes a list of rows; may return insertRows()-style
+            {'inserted': n, 'errors': [...]}. Exceptions trigger a retry (of
+            the rows after `exception.done`, if it has that attribute), and so
+            does a result where every row failed, up to `max_rejected_retries`
+            times, in case the failures were not really about the rows.
+        name (str): Used for spill file names.
+        maxsize (int): Maximum number of queued rows before submit() pushes back.
+        batch_size (int): Maximum rows per flush.
+        interval (float): Seconds to wait for more rows before flushing a partial batch.
+        spill_dir (str): Directory for spill files (defaults to cacheDirectory()).
+    """
+
+    def __init__(self, flush, name='queue', maxsize=1000, batch_size=100, interval=0.5, spill_dir=None,
+                 max_rejected_retries=5):
+        self.flush = flush
+        self.name = name
+        self.max_rejected_retries = max_rejected_retries
+        self.batch_size = batch_size
+        self.interval = interval
+        self.spill_dir = spill_dir or cacheDirectory()
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._inflight = []
+        self._recovered = []
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'flushed': 0,
+            'row_errors': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'spilled': 0,
+            'recovered': 0,
+            'max_depth': 0,
+            'last_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def submit(self, row, timeout=0):
+        """
+        Queue one row for writing.
+
+        Args:
+            row: The row to write (must be JSON serializable to survive a spill).
+            timeout (float): Seconds to wait for space if the queue is full.
+
+        Returns:
+            bool: False if the queue stayed full (the caller should push back).
+        """
+        self._ensureStarted()
+        try:
+            self._queue.put(row, block=timeout > 0, timeout=timeout or None)
+        except queue.Full:
+            self._stats['rejected'] += 1
+            return False
+        self._stats['submitted'] += 1
+        self._stats['max_depth'] = max(self._stats['max_depth'], self._queue.qsize())
+        return True
+
+    def pending(self):
+        """
+        Returns a snapshot of rows accepted but not yet written, oldest first.
+        """
+        with self._queue.mutex:
+            return list(self._recovered) + list(self._inflight) + list(self._queue.queue)
+
+    def stats(self):
+        """
+        Returns queue depth and flush counters/latencies for this process.
+        """
+        stats = dict(self._stats)
+        stats['depth'] = self._queue.qsize()
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        return stats
+
+    def stop(self, timeout=5.0):
+        """
+        Stop the worker, giving it `timeout` seconds to drain, and spill whatever is left.
+
+        A batch the worker is still writing after `timeout` is left to it: it
+        may be committing right now, and spilling it too would replay the rows
+        twice. If that write then fails, the worker spills the batch itself.
+        """
+        self._stopping.set()
+        exited = False
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+            exited = not self._thread.is_alive()
+        self._spill(include_inflight=exited)
+
+    def _ensureStarted(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._recover()
+            self._thread = threading.Thread(target=self._run, name=f"writebehind-{self.name}", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        # Rows recovered from a previous spill go first, outside the bounded queue
+        while self._recovered:
+            with self._queue.mutex:
+                batch, self._recovered = self._recovered[:self.batch_size], self._recovered[self.batch_size:]
+                self._inflight = batch
+            if not self._write(batch):
+                self._spill()
+                return
+            with self._queue.mutex:
+                self._inflight = []
+
+        while True:
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            with self._queue.mutex:
+                self._inflight = batch
+            if not self._write(batch):
+                self._spill()
+                return
+            with self._queue.mutex:
+                self._inflight = []
+
+    def _write(self, batch):
+        # Retry failed batches with backoff; while we retry the queue fills up
+        # and submit() pushes back on callers instead of dropping rows. Returns
+        # False if we gave up because of shutdown (the batch is then spilled).
+        delay = self.interval
+        rejected_retries = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                result = self.flush(batch)
+            except Exception as e:
+                # Rows before `done` were handled; only the rest are retried
+                done = getattr(e, 'done', 0)
+                if done:
+                    batch[:] = batch[done:]
+                    self._stats['flushed'] += done
+                self._stats['failed_flushes'] += 1
+                log.error("write-behind flush failed", extra={'queue': self.name, 'rows': len(batch), 'error': str(e)})
+                if self._stopping.is_set():
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+
+            elapsed = (time.perf_counter() - start) * 1000
+            errors = len(result.get('errors', [])) if isinstance(result, dict) else 0
+            if errors and errors == len(batch) and rejected_retries < self.max_rejected_retries:
+                # Every row failing looks like the database, not the data: retry
+                rejected_retries += 1
+                self._stats['failed_flushes'] += 1
+                log.warning("write-behind batch rejected entirely, retrying",
+                            extra={'queue': self.name, 'rows': len(batch), 'attempt': rejected_retries})
+                if self._stopping.is_set():
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+
+            self._stats['flushes'] += 1
+            self._stats['flushed'] += len(batch) - errors
+            self._stats['row_errors'] += errors
+            self._stats['last_flush_ms'] = elapsed
+            self._stats['total_flush_ms'] += elapsed
+            return True
+
+    def _spillPattern(self):
+        return os.path.join(self.spill_dir, f"{self.name}-*.ndjson")
+
+    def _spill(self, include_inflight=True):
+        with self._queue.mutex:
+            rows = list(self._recovered) + (list(self._inflight) if include_inflight else []) + list(self._queue.queue)
+            self._recovered = []
+            if include_inflight:
+                self._inflight = []
+            self._queue.queue.clear()
+        if not rows:
+            return
+        path = os.path.join(self.spill_dir, f"{self.name}-{os.getpid()}.ndjson")
+        with open(path, 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        self._stats['spilled'] += len(rows)
+        log.warning("write-behind rows spilled", extra={'queue': self.name, 'rows': len(rows), 'path': path})
+
+    def _recover(self):
+        for path in glob.glob(self._spillPattern()):
+            # Renaming claims the file, so only one booting worker replays it
+            claimed = f"{path}.{os.getpid()}.claimed"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed) as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            with self._queue.mutex:
+                self._recovered.extend(rows)
+            self._stats['recovered'] += len(rows)
+            log.info("write-behind rows recovered", extra={'queue': self.name, 'rows': len(rows)})
+            os.unlink(claimed)
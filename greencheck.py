@@ -0,0 +1,11 @@
+# eventlet has to patch the standard library before Flask, Socket.IO and the
+# database drivers are imported, i.e. before the flask_app package is, so the
+# eventlet concurrency check runs from here rather than with `python -m`.
+import eventlet
+eventlet.monkey_patch()
+
+import sys
+from flask_app.utils.database.green import main
+
+if __name__ == "__main__":
+	sys.exit(main())
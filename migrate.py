@@ -0,0 +1,20 @@
+import argparse
+from flask_app.utils.database.database import database
+
+# One-shot schema migration and seeding, meant to run once per deploy
+# (e.g. as a release/pre-deploy command) instead of inside every worker.
+# Set DB_AUTO_MIGRATE=0 on the web service to skip the boot-time check.
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Create, migrate and seed the database schema.')
+	parser.add_argument('--force', action='store_true', help='rebuild and reseed even if the schema is current')
+	parser.add_argument('--check', action='store_true', help='only report whether a migration is needed')
+	args = parser.parse_args()
+
+	db = database(auto_migrate=False)
+	if args.check:
+		current = not db.needsMigration()
+		print('Schema is current' if current else 'Schema needs migrating')
+		raise SystemExit(0 if current else 1)
+
+	changed = db.migrate(force=args.force)
+	print('Schema rebuilt and seeded' if changed else 'Schema already current, nothing to do')